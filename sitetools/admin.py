@@ -10,18 +10,29 @@
 """
 
 # Python imports
+import hashlib
 import datetime
 
 # Django imports
-from django.db import models
+from django.db import connections, models
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    from django.db.models.sql.datastructures import EmptyResultSet
+from django.core.paginator import Paginator
+from django.utils.encoding import force_bytes
+from django.utils.functional import cached_property
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.utils.safestring import mark_safe
 from django.contrib import admin
+from django.contrib.auth import get_user_model
 from django.contrib.admin.filters import FieldListFilter
 from django.contrib.admin.utils import flatten_fieldsets
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.admin.widgets import AdminFileWidget
 from django.contrib.contenttypes.admin import GenericTabularInline
+from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
 
 # Application imports
@@ -29,6 +40,12 @@ from sitetools.models import SiteInfo, SiteLog, SiteVar
 from sitetools.models import LegalDocument, LegalDocumentVersion, LegalDocumentAcceptance
 from sitetools.models import ContactMessage
 from sitetools.models import DBTemplate
+from sitetools.cache import LocalCache
+from sitetools.utils import get_approximate_count
+from sitetools import search
+
+# Changelist counts cache
+admin_count_cache=LocalCache('admincounts',settings.ADMIN_COUNT_CACHE_TIMEOUT,shared=False)
 
 class EnhancedDateFieldListFilter(FieldListFilter):
     """
@@ -178,7 +195,92 @@ class BaseModelAdminLogic(object):
                 [field.name for field in self.opts.local_many_to_many]
             ))
 
-class BaseModelAdmin(BaseModelAdminLogic,admin.ModelAdmin):
+class FullTextSearchAdminMixin(object):
+    """
+    Administration mixin for searching using full text search backend if configured
+    """
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Search using model search backend
+        """
+        backend=search.get_search_backend(self.model)
+        if backend is not None and search_term:
+            results=backend.search(queryset,search_term)
+            if results is not None:
+                return results, False
+        return super(FullTextSearchAdminMixin,self).get_search_results(request,queryset,search_term)
+
+def get_changelist_count(qs):
+    """
+    Get number of rows for a changelist queryset
+
+    Database estimate is used if it is over ADMIN_APPROXIMATE_COUNT_THRESHOLD rows. Counts are
+    kept in cache for ADMIN_COUNT_CACHE_TIMEOUT seconds.
+    """
+    try:
+        key=hashlib.md5(force_bytes('%s:%s' % (qs.db,qs.query))).hexdigest()
+    except EmptyResultSet:
+        return 0
+    count=admin_count_cache.get(key)
+    if count is None:
+        count=get_approximate_count(qs)
+        # Estimates are only returned by PostgreSQL. Other databases already return an exact count
+        if connections[qs.db].vendor == 'postgresql' and count < settings.ADMIN_APPROXIMATE_COUNT_THRESHOLD:
+            count=qs.count()
+        admin_count_cache.set(key,count)
+    return count
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginator using estimated and cached counts for large tables
+    """
+    @cached_property
+    def count(self):
+        return get_changelist_count(self.object_list)
+
+class ApproximateCountQuerySet(object):
+    """
+    Queryset proxy counting rows with get_changelist_count
+    """
+    def __init__(self, qs):
+        self.qs=qs
+
+    def __getattr__(self, name):
+        return getattr(self.qs,name)
+
+    def count(self):
+        return get_changelist_count(self.qs)
+
+class ApproximateCountChangeList(ChangeList):
+    """
+    Changelist using estimated and cached counts for total number of rows
+    """
+    def get_results(self, request):
+        root_queryset=self.root_queryset
+        self.root_queryset=ApproximateCountQuerySet(root_queryset)
+        try:
+            super(ApproximateCountChangeList,self).get_results(request)
+        finally:
+            self.root_queryset=root_queryset
+
+class ApproximateCountAdminMixin(object):
+    """
+    Administration mixin for using estimated and cached counts in changelists when
+    approximate_counts is True
+    """
+    approximate_counts=False
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if self.approximate_counts:
+            return ApproximateCountPaginator(queryset, per_page, orphans, allow_empty_first_page)
+        return super(ApproximateCountAdminMixin,self).get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+
+    def get_changelist(self, request, **kwargs):
+        if self.approximate_counts:
+            return ApproximateCountChangeList
+        return super(ApproximateCountAdminMixin,self).get_changelist(request, **kwargs)
+
+class BaseModelAdmin(BaseModelAdminLogic,ApproximateCountAdminMixin,admin.ModelAdmin):
     """
     Base ModelAdmin administration class
     """
@@ -224,19 +326,93 @@ class SiteLogInline(BaseGenericTabularInline):
     def has_add_permission(self, request):
         return False
 
-class SiteLogAdmin(admin.ModelAdmin):
+class RecentUserListFilter(admin.SimpleListFilter):
+    """
+    User filter listing only users of the most recent site log entries
+
+    Any user can still be filtered using its identifier in "user" parameter
+    """
+    title = _('User')
+    parameter_name = 'user'
+    # Number of recent entries examined and maximum number of users listed
+    scan_size = 1000
+    max_users = 50
+
+    def lookups(self, request, model_admin):
+        ids=[]
+        for user_id in model_admin.model.objects.filter(user__isnull=False).order_by('-timestamp').values_list('user',flat=True)[:self.scan_size]:
+            if user_id not in ids:
+                ids.append(user_id)
+                if len(ids) >= self.max_users:
+                    break
+        users=get_user_model()._default_manager.in_bulk(ids)
+        return [(unicode(user_id),unicode(users[user_id])) for user_id in ids if user_id in users]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            try:
+                return queryset.filter(user_id=int(self.value()))
+            except ValueError:
+                return queryset.none()
+        return queryset
+
+def prefetch_content_objects(objs,field='content_object'):
+    """
+    Fetch generic foreign key objects for a list of objects with a query for each content type
+
+    Unlike prefetch_related, content types of removed models are skipped, leaving their
+    content objects empty
+    """
+    objs=list(objs)
+    if not objs:
+        return
+    gfk=getattr(objs[0].__class__,field)
+    ids={}
+    for obj in objs:
+        ct_id=getattr(obj,gfk.ct_field + '_id')
+        fk=getattr(obj,gfk.fk_field)
+        if ct_id is not None and fk is not None:
+            ids.setdefault(ct_id,set()).add(fk)
+    found={}
+    for ct_id,fks in ids.items():
+        model=ContentType.objects.get_for_id(ct_id).model_class()
+        if model is None:
+            # Content type of a removed model
+            continue
+        for pk,instance in model._base_manager.in_bulk(list(fks)).items():
+            found[(ct_id,pk)]=instance
+    for obj in objs:
+        setattr(obj,gfk.cache_attr,found.get((getattr(obj,gfk.ct_field + '_id'),getattr(obj,gfk.fk_field))))
+
+class ContentObjectChangeListMixin(object):
+    """
+    Changelist mixin fetching content objects of results with a query for each content type
+    """
+    def get_results(self, request):
+        super(ContentObjectChangeListMixin,self).get_results(request)
+        prefetch_content_objects(self.result_list)
+
+class SiteLogAdmin(FullTextSearchAdminMixin,ApproximateCountAdminMixin,admin.ModelAdmin):
     """
     Site log administration class
     """
+    approximate_counts = True
     # Admin parameters    
     list_display = ('timestamp','tag','message','level','ip','user','content_type','object_id','admin_content_object')
-    list_filter = ('timestamp','level','tag','user')
+    list_filter = ('timestamp','level','tag',RecentUserListFilter)
+    list_select_related = ('user','content_type')
     search_fields = ('message','tag','user__username','user__first_name','user__last_name','ip','data')
     ordering = ('-timestamp',)
 
     def has_add_permission(self, request):
         return False
 
+    def get_changelist(self, request, **kwargs):
+        """
+        Get changelist class fetching content objects of results
+        """
+        return type('SiteLogChangeList',(ContentObjectChangeListMixin,super(SiteLogAdmin,self).get_changelist(request,**kwargs)),{})
+
     def admin_content_object(self,obj):
         """
         Show content object unicode representation
@@ -278,15 +454,17 @@ class LegalDocumentAcceptanceAdmin(BaseModelAdmin):
     """
     list_display = ('__unicode__','timestamp','documentversion','user','desc')
     list_filter = ('timestamp','documentversion','user',)
+    approximate_counts = True
     search_fields = ('documentversion__document__name','documentversion__version','user__first_name','user__last_name','desc','data',)
 
-class ContactMessageAdmin(BaseModelAdmin):
+class ContactMessageAdmin(FullTextSearchAdminMixin,BaseModelAdmin):
     """
     Contact message administration class
     """
     list_display = ('timestamp','name','email','ip','replied')
     search_fields = ('name','email','ip','text')
     list_filter = ('timestamp','replied',)
+    approximate_counts = True
 
 # Admin models registration
 admin.site.register(SiteInfo, SiteInfoAdmin)
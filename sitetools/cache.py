@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Site tools caching module
+===============================================
+
+.. module:: sitetools.cache
+    :platform: Django
+    :synopsis: Site tools caching module
+.. moduleauthor:: (C) 2014 Oliver Gutiérrez
+"""
+
+# Python imports
+import time
+import threading
+from collections import OrderedDict
+
+# Django imports
+from django.conf import settings
+
+# Marker for using default cache timeout
+DEFAULT_TIMEOUT = object()
+
+class LocalCache(object):
+    """
+    Process local cache with expiration timeout and least recently used entries eviction
+
+    When SITE_CACHE_BACKEND is set, cache invalidations are shared between processes using
+    a version counter stored in that Django cache
+    """
+    # Marker for missing entries
+    MISSING = object()
+
+    def __init__(self,name,timeout=None,maxsize=1000,sync_interval=1,shared=True):
+        """
+        Class initialization method
+
+        :param name: Cache name. Used for building shared version key
+        :type name: String
+        :param timeout: Default expiration time in seconds (SITE_CACHE_TIMEOUT if not specified)
+        :type timeout: Integer
+        :param maxsize: Maximum number of entries (None for unlimited)
+        :type maxsize: Integer
+        :param sync_interval: Minimum seconds between shared version checks
+        :type sync_interval: Integer
+        :param shared: Share invalidations between processes if SITE_CACHE_BACKEND is set
+        :type shared: Boolean
+        """
+        self.name=name
+        self.timeout=timeout
+        self.maxsize=maxsize
+        self.sync_interval=sync_interval
+        self.shared=shared
+        self._data=OrderedDict()
+        self._lock=threading.RLock()
+        self._version=None
+        self._synced=0
+        self.hits=0
+        self.misses=0
+
+    def get_timeout(self):
+        """
+        Get default expiration time for cache entries
+        """
+        if self.timeout is None:
+            return settings.SITE_CACHE_TIMEOUT
+        return self.timeout
+
+    def get_shared_cache(self):
+        """
+        Get Django cache used for sharing invalidations or None if not configured
+        """
+        if self.shared and settings.SITE_CACHE_BACKEND:
+            from django.core.cache import caches
+            return caches[settings.SITE_CACHE_BACKEND]
+        return None
+
+    def get_version_key(self):
+        """
+        Get shared version key for this cache
+        """
+        return 'sitetools:%s:version' % self.name
+
+    def sync(self):
+        """
+        Clear local entries if cache has been invalidated by another process
+        """
+        now=time.time()
+        if now - self._synced < self.sync_interval:
+            return
+        self._synced=now
+        shared=self.get_shared_cache()
+        if shared is not None:
+            version=shared.get(self.get_version_key())
+            if version != self._version:
+                with self._lock:
+                    self._data.clear()
+                    self._version=version
+
+    def get(self,key,default=None):
+        """
+        Get a value from cache
+        """
+        self.sync()
+        with self._lock:
+            try:
+                expires,value=self._data.pop(key)
+            except KeyError:
+                self.misses+=1
+                return default
+            if expires is not None and expires < time.time():
+                self.misses+=1
+                return default
+            # Move entry to most recently used position
+            self._data[key]=(expires,value)
+        self.hits+=1
+        return value
+
+    def set(self,key,value,timeout=DEFAULT_TIMEOUT):
+        """
+        Set a value in cache
+
+        A timeout of None means the entry never expires and 0 means the value is not cached
+        """
+        if timeout is DEFAULT_TIMEOUT:
+            timeout=self.get_timeout()
+        if timeout is not None:
+            if not timeout:
+                return
+            timeout=time.time() + timeout
+        with self._lock:
+            self._data.pop(key,None)
+            self._data[key]=(timeout,value)
+            # Evict least recently used entries
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+    def delete(self,key):
+        """
+        Delete a value from local cache
+        """
+        with self._lock:
+            self._data.pop(key,None)
+
+    def clear(self):
+        """
+        Clear cache contents in current process and all processes sharing SITE_CACHE_BACKEND
+        """
+        with self._lock:
+            self._data.clear()
+        shared=self.get_shared_cache()
+        if shared is not None:
+            key=self.get_version_key()
+            shared.add(key,0,None)
+            try:
+                self._version=shared.incr(key)
+            except ValueError:
+                # Key has been evicted meanwhile
+                pass
+
+    def __len__(self):
+        """
+        Number of entries stored in cache
+        """
+        return len(self._data)
@@ -9,9 +9,30 @@ Site tools feeds module
 .. moduleauthor:: (C) 2014 Oliver Gutiérrez
 """
 
+# Python imports
+import copy
+import hashlib
+import calendar
+from io import BytesIO
+
 # Django imports
 from django.contrib.syndication.views import Feed
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Max, Count
+from django.db.models.query import QuerySet
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
 from django.utils.feedgenerator import Rss201rev2Feed
+from django.utils.http import http_date
+from django.utils.xmlutils import SimplerXMLGenerator
+
+# Application imports
+from sitetools.cache import LocalCache
+from sitetools.utils import get_site_from_request, is_not_modified
+
+# Rendered feeds cache by feed, site and URL
+feed_cache=LocalCache('feeds')
 
 class BaseRSSFeedGenerator(Rss201rev2Feed):
     """
@@ -42,11 +63,152 @@ class BaseRSSFeedGenerator(Rss201rev2Feed):
             handler.addQuickElement('link', feed['link'])
             handler.endElement(u'image')
 
+    def iter_document(self, handler, buf, chunks):
+        """
+        Iterate over feed document parts, writing items from given feed generators chunks
+        """
+        handler.startDocument()
+        handler.startElement(u'rss', self.rss_attributes())
+        handler.startElement(u'channel', self.root_attributes())
+        self.add_root_elements(handler)
+        for generator in chunks:
+            for item in generator.items:
+                handler.startElement(u'item', generator.item_attributes(item))
+                generator.add_item_elements(handler, item)
+                handler.endElement(u'item')
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        self.endChannelElement(handler)
+        handler.endElement(u'rss')
+        yield buf.getvalue()
+
 class BaseRSSFeed(Feed):
     """
     Enhanced base feed class
+
+    When latest_field is set to the name of a items timestamp field, rendered feeds are cached
+    by feed, site and URL until a newer item appears or the number of items changes, and
+    ETag and Last-Modified headers are used for answering conditional requests.
+
+    When streaming is True, feeds are sent using a streaming response, rendering items in
+    chunks of chunk_size. Streamed feeds are not cached.
     """
     feed_type=BaseRSSFeedGenerator
+    # Items timestamp field used for validating cached feeds
+    latest_field=None
+    # Stream feed items instead of rendering the full document
+    streaming=False
+    # Number of items rendered at once when streaming
+    chunk_size=100
+
+    def __call__(self, request, *args, **kwargs):
+        """
+        Feed view
+        """
+        try:
+            obj=self.get_object(request, *args, **kwargs)
+        except ObjectDoesNotExist:
+            raise Http404('Feed object does not exist.')
+        if self.streaming:
+            return self.get_streaming_response(obj, request)
+        state=self.get_feed_state(obj)
+        if state is None:
+            # Feed can not be validated. Render it on each request
+            return super(BaseRSSFeed, self).__call__(request, *args, **kwargs)
+        latest, count=state
+        mtime=calendar.timegm(latest.utctimetuple())
+        site=get_site_from_request(request)
+        key=(self.__class__.__module__, self.__class__.__name__, site.domain if site else None, request.get_full_path())
+        etag='"%s"' % hashlib.md5(force_bytes(u'%r:%s:%d' % (key, latest.isoformat(), count))).hexdigest()
+        if is_not_modified(request, etag, mtime):
+            response=HttpResponseNotModified()
+        else:
+            entry=feed_cache.get(key)
+            if entry is None or entry['etag'] != etag:
+                feedgen=self.get_feed(obj, request)
+                entry={
+                    'etag': etag,
+                    'content': feedgen.writeString('utf-8'),
+                    'content_type': feedgen.content_type,
+                }
+                feed_cache.set(key, entry)
+            response=HttpResponse(entry['content'], content_type=entry['content_type'])
+        response['ETag']=etag
+        response['Last-Modified']=http_date(mtime)
+        return response
+
+    def get_feed_state(self, obj):
+        """
+        Get newest item timestamp and number of items, or None if feed can not be validated
+        """
+        if self.latest_field is None:
+            return None
+        items=self._get_dynamic_attr('items', obj)
+        if not isinstance(items, QuerySet):
+            return None
+        if items.query.low_mark or items.query.high_mark is not None:
+            # Sliced querysets can not be aggregated
+            items=items.model._default_manager.filter(pk__in=list(items.values_list('pk', flat=True)))
+        state=items.aggregate(latest=Max(self.latest_field), count=Count('pk'))
+        latest=state['latest']
+        if latest is None:
+            return None
+        if timezone.is_naive(latest):
+            latest=timezone.make_aware(latest, timezone.get_current_timezone())
+        return latest, state['count']
+
+    def iter_item_chunks(self, obj):
+        """
+        Iterate over items in chunks of chunk_size, fetching querysets in slices
+        """
+        items=self._get_dynamic_attr('items', obj)
+        if isinstance(items, QuerySet):
+            start=items.query.low_mark
+            end=items.query.high_mark
+            items=items._clone()
+            items.query.clear_limits()
+            while end is None or start < end:
+                stop=start + self.chunk_size
+                if end is not None:
+                    stop=min(stop, end)
+                chunk=list(items[start:stop])
+                if chunk:
+                    yield chunk
+                if len(chunk) < stop - start:
+                    break
+                start=stop
+        else:
+            items=list(items)
+            for i in range(0, len(items), self.chunk_size):
+                yield items[i:i + self.chunk_size]
+
+    def get_chunk_feed(self, obj, request, chunk):
+        """
+        Get feed generator for a chunk of items
+        """
+        feed=copy.copy(self)
+        feed.items=lambda: chunk
+        return Feed.get_feed(feed, obj, request)
+
+    def get_streaming_response(self, obj, request):
+        """
+        Get streaming response for feed
+        """
+        chunks=self.iter_item_chunks(obj)
+        first=next(chunks, [])
+        # Feed header is generated using first items chunk for getting the right last build date
+        feedgen=self.get_chunk_feed(obj, request, first)
+
+        def generators():
+            yield feedgen
+            for chunk in chunks:
+                yield self.get_chunk_feed(obj, request, chunk)
+
+        buf=BytesIO()
+        handler=SimplerXMLGenerator(buf, 'utf-8')
+        return StreamingHttpResponse(feedgen.iter_document(handler, buf, generators()),
+                                     content_type=feedgen.content_type)
 
     def feed_extra_kwargs(self,obj):
         return {
@@ -1,16 +1,17 @@
 # Python imports
-import urllib
-import urllib2
+import json
 import warnings
 
 # Django imports
 from django import forms
+from django.utils import six
 from django.utils.translation import ugettext, ugettext_lazy as _
 from django.utils.safestring import mark_safe
 from django.conf import settings
 
 # Site tools imports
 from sitetools.forms.widgets import RECAPTCHAWidget, TinyMCEWidget, AceEditorWidget, LocationWidget, VectorWidget
+from sitetools.forms.recaptcha import RECAPTCHAUnavailable, get_verifier
 
 
 class EULAField(forms.Field):
@@ -43,11 +44,14 @@ class EULAField(forms.Field):
 class RECAPTCHAField(forms.Field):
     """
     reCATCHA form field class
+
+    Answers are checked with the verifier configured in RECAPTCHA_VERIFIER setting. If the
+    verification service is unavailable, answers are accepted if RECAPTCHA_FAIL_OPEN is enabled
     """
     def __init__(self, pubkey=settings.RECAPTCHA_PUB_KEY, privkey=settings.RECAPTCHA_PRIV_KEY,
                  api_server='https://www.google.com/recaptcha/api',
                  verify_server='https://www.google.com/recaptcha/api/verify',
-                 *args, **kwargs):
+                 verifier=None, *args, **kwargs):
         """
         Class initialization
         """
@@ -57,6 +61,7 @@ class RECAPTCHAField(forms.Field):
         self.privkey = privkey
         self.api_server = api_server
         self.verify_server = verify_server
+        self.verifier = verifier
         kwargs.setdefault('widget', RECAPTCHAWidget(self.api_server, self.pubkey))
         super(RECAPTCHAField, self).__init__(*args, **kwargs)
 
@@ -69,31 +74,15 @@ class RECAPTCHAField(forms.Field):
         # Check captcha input
         if not (captcharesp and challenge and len(captcharesp) and len(challenge)):
             raise forms.ValidationError(ugettext('Invalid verification'))
-        # Generate request to recaptcha servers
-        verifreq = urllib2.Request(
-            url=self.verify_server,
-            data=urllib.urlencode({
-                'privatekey': self.privkey,
-                'remoteip': None,
-                'challenge': challenge.encode('utf-8'),
-                'response': captcharesp.encode('utf-8'),
-            }),
-            headers={
-                'Content-type': 'application/x-www-form-urlencoded',
-                'User-agent': 'Python'
-            }
-        )
-        # Do request
+        # Verify captcha response
         try:
-            resp=urllib2.urlopen(verifreq)
-        except:
-            # In case of connection error just accept captcha as valid
-            return
-        # Check captcha response
-        return_values=resp.read().splitlines();
-        resp.close();
-        return_code=return_values[0]
-        if (return_code!="true"):
+            valid = get_verifier(self.verifier).verify(self.verify_server, self.privkey, challenge, captcharesp)
+        except RECAPTCHAUnavailable:
+            if settings.RECAPTCHA_FAIL_OPEN:
+                # In case of connection error just accept captcha as valid
+                return
+            raise forms.ValidationError(_('Verification service unavailable. Please try again later'))
+        if not valid:
             raise forms.ValidationError(_('Invalid verification'))
 
 
@@ -121,6 +110,29 @@ class AceEditorField(forms.CharField):
         super(AceEditorField,self).__init__(*args,**kwargs)
 
 
+class JSONFormField(forms.CharField):
+    """
+    JSON data form field
+    """
+    def __init__(self, encoder=json.dumps, *args, **kwargs):
+        """
+        Class initialization
+
+        :param encoder: Function used for encoding decoded values as JSON
+        """
+        self.encoder = encoder
+        kwargs.setdefault('widget', forms.Textarea)
+        super(JSONFormField, self).__init__(*args, **kwargs)
+
+    def prepare_value(self, value):
+        """
+        Encode decoded values as JSON for editing them
+        """
+        if value is None or isinstance(value, six.string_types):
+            return value
+        return self.encoder(value)
+
+
 class VectorFormField(forms.MultiValueField):
     """
     N dimensional vector field
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Site tools reCAPTCHA verification module
+===============================================
+
+.. module:: sitetools.forms.recaptcha
+    :platform: Django
+    :synopsis: Site tools reCAPTCHA verification module
+.. moduleauthor:: (C) 2014 Oliver Gutiérrez
+"""
+
+# Python imports
+import time
+import urllib
+import httplib
+import hashlib
+import urlparse
+import threading
+
+# Django imports
+from django.utils.module_loading import import_string
+from django.conf import settings
+
+# Application imports
+from sitetools.cache import LocalCache
+
+
+class RECAPTCHAUnavailable(Exception):
+    """
+    Exception raised when reCAPTCHA verification service can not be reached
+    """
+    pass
+
+
+class BaseRECAPTCHAVerifier(object):
+    """
+    Base reCAPTCHA verifier class
+
+    Successful verifications are cached for RECAPTCHA_VERIFIED_CACHE_TIMEOUT seconds, so forms
+    redisplayed because of other fields errors can be submitted again with the same answer.
+    Cached answers are accepted only once to avoid replaying them.
+    """
+    def __init__(self):
+        """
+        Class initialization
+        """
+        self.verified = LocalCache('recaptcha', settings.RECAPTCHA_VERIFIED_CACHE_TIMEOUT, shared=False)
+        self._lock = threading.Lock()
+
+    def verify(self, verify_server, privkey, challenge, response, remoteip=None):
+        """
+        Verify a reCAPTCHA answer
+
+        :returns: True if answer is valid
+        :raises: RECAPTCHAUnavailable if verification service can not be reached
+        """
+        key = hashlib.md5(('%s:%s' % (challenge, response)).encode('utf-8')).hexdigest()
+        with self._lock:
+            cached = self.verified.get(key)
+            if cached:
+                self.verified.delete(key)
+        if cached:
+            return True
+        valid = self.check(verify_server, privkey, challenge, response, remoteip)
+        if valid:
+            self.verified.set(key, True)
+        return valid
+
+    def check(self, verify_server, privkey, challenge, response, remoteip=None):
+        """
+        Check a reCAPTCHA answer against verification service
+        """
+        raise NotImplementedError()
+
+
+class HTTPRECAPTCHAVerifier(BaseRECAPTCHAVerifier):
+    """
+    reCAPTCHA verifier using reCAPTCHA servers
+
+    Connections are kept alive and reused by each thread. After RECAPTCHA_CIRCUIT_FAILURES
+    consecutive failures, the service is considered unavailable without trying to connect
+    during RECAPTCHA_CIRCUIT_TIMEOUT seconds.
+    """
+    def __init__(self):
+        """
+        Class initialization
+        """
+        super(HTTPRECAPTCHAVerifier, self).__init__()
+        self._local = threading.local()
+        self._failures = 0
+        self._opened = 0
+
+    def get_connection(self, scheme, host):
+        """
+        Get current thread connection for given host
+        """
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get((scheme, host))
+        if conn is None:
+            if scheme == 'https':
+                conn = httplib.HTTPSConnection(host, timeout=settings.RECAPTCHA_TIMEOUT)
+            else:
+                conn = httplib.HTTPConnection(host, timeout=settings.RECAPTCHA_TIMEOUT)
+            connections[(scheme, host)] = conn
+        return conn
+
+    def post(self, url, data):
+        """
+        Do a POST request and return response body
+        """
+        parts = urlparse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        headers = {
+            'Content-type': 'application/x-www-form-urlencoded',
+            'User-agent': 'Python',
+            'Connection': 'keep-alive',
+        }
+        conn = self.get_connection(parts.scheme, parts.netloc)
+        # Retry once because kept alive connections may have been closed by server
+        for retry in (True, False):
+            try:
+                conn.request('POST', path, urllib.urlencode(data), headers)
+                resp = conn.getresponse()
+                return resp.read()
+            except (httplib.HTTPException, IOError):
+                conn.close()
+                if not retry:
+                    raise
+
+    def check(self, verify_server, privkey, challenge, response, remoteip=None):
+        """
+        Check a reCAPTCHA answer against reCAPTCHA servers
+        """
+        if self._failures >= settings.RECAPTCHA_CIRCUIT_FAILURES:
+            if time.time() - self._opened < settings.RECAPTCHA_CIRCUIT_TIMEOUT:
+                raise RECAPTCHAUnavailable('reCAPTCHA verification disabled after repeated failures')
+        try:
+            content = self.post(verify_server, {
+                'privatekey': privkey,
+                'remoteip': remoteip,
+                'challenge': challenge.encode('utf-8'),
+                'response': response.encode('utf-8'),
+            })
+        except (httplib.HTTPException, IOError), e:
+            self._failures += 1
+            self._opened = time.time()
+            raise RECAPTCHAUnavailable(e)
+        self._failures = 0
+        lines = content.splitlines()
+        return bool(lines) and lines[0] == 'true'
+
+
+class LocalRECAPTCHAVerifier(BaseRECAPTCHAVerifier):
+    """
+    reCAPTCHA verifier for tests and offline environments
+
+    Every answer is valid except those listed in RECAPTCHA_LOCAL_INVALID_RESPONSES
+    """
+    def check(self, verify_server, privkey, challenge, response, remoteip=None):
+        """
+        Check a reCAPTCHA answer locally
+        """
+        return response not in settings.RECAPTCHA_LOCAL_INVALID_RESPONSES
+
+
+# Verifier instances by class path
+_verifiers = {}
+
+
+def get_verifier(path=None):
+    """
+    Get reCAPTCHA verifier instance for given class path or RECAPTCHA_VERIFIER setting
+    """
+    if path is None:
+        path = settings.RECAPTCHA_VERIFIER
+    verifier = _verifiers.get(path)
+    if verifier is None:
+        verifier = _verifiers.setdefault(path, import_string(path)())
+    return verifier
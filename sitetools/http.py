@@ -11,14 +11,16 @@
 """
 
 # Python imports
-import os, json, mimetypes
+import json, errno, mmap, uuid
 
 # Django imports
-from django.http import HttpResponse
-# from django.core.servers.basehttp import FileWrapper
-from wsgiref.util import FileWrapper
+from django.http import HttpResponse, FileResponse
+from django.utils.http import http_date, parse_http_date_safe
 from django.conf import settings
 
+# Application imports
+from sitetools.utils import get_file_metadata, is_not_modified
+
 class HttpResponseServiceUnavailable(HttpResponse):
     """
     **Subclass for HttpResponse with 503 status code**
@@ -43,15 +45,145 @@ class JSONResponse(HttpResponse):
         # Call parent initialization
         super(JSONResponse,self).__init__(content,*args,**kwargs)
 
-class StaticSendFileResponse(HttpResponse):
+def parse_range_header(header,size,max_ranges=16):
+    """
+    Parse HTTP Range header for a file of given size
+
+    :returns: List of (first byte, last byte) tuples, an empty list if no range can be satisfied or
+        None if header must be ignored (invalid or too many ranges)
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges=[]
+    for spec in header[6:].split(','):
+        spec=spec.strip()
+        if not spec:
+            continue
+        start,sep,end=spec.partition('-')
+        if not sep:
+            return None
+        try:
+            if not start.strip():
+                # Suffix range with last bytes of file
+                start=max(size - int(end),0)
+                end=size - 1
+            else:
+                start=int(start)
+                end=min(int(end),size - 1) if end.strip() else size - 1
+        except ValueError:
+            return None
+        if start < 0 or (end < start and start < size):
+            return None
+        if start <= end:
+            ranges.append((start,end))
+    if len(ranges) > max_ranges:
+        return None
+    return ranges
+
+def parse_accept_encoding(header):
+    """
+    Parse HTTP Accept-Encoding header
+
+    :returns: Dictionary with quality values by encoding
+    """
+    encodings={}
+    for item in header.split(','):
+        parts=item.split(';')
+        encoding=parts[0].strip().lower()
+        if not encoding:
+            continue
+        quality=1.0
+        for param in parts[1:]:
+            name,sep,value=param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality=float(value)
+                except ValueError:
+                    quality=0.0
+        encodings[encoding]=quality
+    return encodings
+
+def get_encoded_file(filepath,metadata,request=None):
+    """
+    Get precompressed version of a file accepted by client. Outdated versions are ignored
+
+    :returns: Tuple with file path, file metadata, content encoding (None for original file) and
+        a boolean value indicating if file has precompressed versions
+    """
+    accepted={}
+    if request is not None:
+        accepted=parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING',''))
+    has_variants=False
+    for encoding,extension in settings.STATIC_PRECOMPRESSED_ENCODINGS:
+        encoded=get_file_metadata(filepath + extension)
+        if encoded is None or encoded.mtime < metadata.mtime:
+            continue
+        has_variants=True
+        if accepted.get(encoding,accepted.get('*',0)) > 0:
+            return filepath + extension,encoded,encoding,True
+    return filepath,metadata,None,has_variants
+
+def get_static_metadata(filepath):
+    """
+    Get static file metadata
+
+    :raises: IOError if file does not exist
+    """
+    metadata=get_file_metadata(filepath)
+    if metadata is None:
+        raise IOError(errno.ENOENT,'File does not exist',filepath)
+    return metadata
+
+def is_file_not_modified(request,metadata):
+    """
+    Check if a GET or HEAD request conditional headers match file ETag or modification time
+    """
+    return request is not None and request.method in ('GET','HEAD') and is_not_modified(request,metadata.etag,metadata.mtime)
+
+class StaticFileResponseMixin(object):
+    """
+    Common logic for static file responses
+    """
+    def setup_file(self,filepath,metadata,request=None):
+        """
+        Select precompressed file accepted by client and set validation headers
+
+        :returns: Tuple with served file path and its metadata
+        """
+        filepath,metadata,encoding,has_variants=get_encoded_file(filepath,metadata,request)
+        if has_variants:
+            self['Vary']='Accept-Encoding'
+        if encoding is not None:
+            self['Content-Encoding']=encoding
+        self['Last-Modified']=http_date(metadata.mtime)
+        self['ETag']=metadata.etag
+        return filepath,metadata
+
+    def setup_headers(self,download_as=None,extra_headers={}):
+        """
+        Set download and custom headers
+        """
+        if download_as:
+            self['Content-Disposition'] = 'attachment; filename=%s' % download_as
+        for k,v in extra_headers.items():
+            self[k] = v
+
+    def is_not_modified(self,request,metadata):
+        """
+        Check request conditional headers against file ETag and modification time
+        """
+        return is_file_not_modified(request,metadata)
+
+class StaticSendFileResponse(StaticFileResponseMixin,HttpResponse):
     """
     **Static serve response class**
     
     *Django HttpResponse for serving static content through xsendfile or xaccel*
     
-    If the user is in debug mode then 
+    If the user is in debug mode or direct backend is used then the file contents are added to the
+    response. Use get_static_response for streaming them with DirectFileResponse instead.
     """
-    def __init__(self,filepath,backend=settings.STATIC_SENDFILE_BACKEND,download_as=None,force_backend=False,extra_headers={},*args,**kwargs):
+    def __init__(self,filepath,backend=settings.STATIC_SENDFILE_BACKEND,download_as=None,force_backend=False,extra_headers={},request=None,*args,**kwargs):
         """
         Class initialization method
 
@@ -62,34 +194,156 @@ class StaticSendFileResponse(HttpResponse):
         :param download_as: Filename that will be used for download
         :type download_as: String
         :param force_backend: Force using backend on debug mode instead using django
+        :param request: Current request. Used for conditional requests and precompressed files negotiation
+        :type request: HttpRequest
         :raises: ValueError if an invalid backend is specified
         
         .. note:: Valid options for backend parameter are:
         
             * **mod_xsendfile**: Use Apache mod_xsendfile for serving the static file.
             * **nginx_xaccel**: Use nginx X-Accel-Redirect for serving the static file. You can pass extra parameters using extra_headers. Some useful parms are X-Accel-Limit-Rate, X-Accel-Buffering or X-Accel-Charset
+            * **direct**: Serve the file from Django.
+
+        .. note:: Precompressed files with extensions from STATIC_PRECOMPRESSED_ENCODINGS setting
+            (file.js.br, file.js.gz, etc.) are served instead of original file if client accepts them
         """
-        # Guess file mimetype
-        content_type=mimetypes.guess_type(filepath)[0]
-        kwargs.setdefault('content_type',content_type)
- 
-        if settings.DEBUG and not force_backend:
+        # Get cached file metadata
+        metadata=get_static_metadata(filepath)
+        kwargs.setdefault('content_type',metadata.content_type)
+
+        super(StaticSendFileResponse,self).__init__(*args,**kwargs)
+        filepath,metadata=self.setup_file(filepath,metadata,request)
+        if self.is_not_modified(request,metadata):
+            self.status_code=304
+        elif backend=='direct' or (settings.DEBUG and not force_backend):
             # Serve file directly
-            wrapper = FileWrapper(file(filepath))
-            super(StaticSendFileResponse,self).__init__(wrapper,*args,**kwargs)
-            self['Content-Length'] = os.path.getsize(filepath)
+            with open(filepath,'rb') as f:
+                self.content=f.read()
         else:
             # Serve file using HTTP server
-            super(StaticSendFileResponse,self).__init__(*args,**kwargs)       
             if backend=='mod_xsendfile':
                 self['X-Sendfile'] = filepath
             elif backend=='nginx_xaccel':
                 self['X-Accel-Redirect'] = filepath
             else:
                 raise Exception('Invalid static serving backend "%s"' % backend)
-        # Setup download headers
-        if download_as:
-            self['Content-Disposition'] = 'attachment; filename=%s' % download_as
-        # Setup custom headers
-        for k,v in extra_headers.items():
-            self[k] = v
\ No newline at end of file
+        self.setup_headers(download_as,extra_headers)
+
+class DirectFileResponse(StaticFileResponseMixin,FileResponse):
+    """
+    **Direct static serve response class**
+
+    *Django streaming response for serving static content from Django, using WSGI server file
+    wrapper (sendfile) if available. Supports range requests.*
+    """
+    # Block size for partial contents
+    block_size=65536
+
+    def __init__(self,filepath,download_as=None,extra_headers={},request=None,*args,**kwargs):
+        """
+        Class initialization method
+
+        :param filepath: File path you want to serve
+        :type filepath: String
+        :param download_as: Filename that will be used for download
+        :type download_as: String
+        :param request: Current request. Used for precompressed files negotiation and range requests
+        :type request: HttpRequest
+        """
+        metadata=get_static_metadata(filepath)
+        kwargs.setdefault('content_type',metadata.content_type)
+        super(DirectFileResponse,self).__init__(*args,**kwargs)
+        filepath,metadata=self.setup_file(filepath,metadata,request)
+        self.serve_direct(filepath,metadata,request)
+        self.setup_headers(download_as,extra_headers)
+
+    def serve_direct(self,filepath,metadata,request=None):
+        """
+        Setup response for serving file contents directly
+        """
+        size=metadata.size
+        self['Accept-Ranges']='bytes'
+        ranges=None
+        if request is not None and request.method in ('GET','HEAD') and self.is_range_valid(request,metadata):
+            ranges=parse_range_header(request.META.get('HTTP_RANGE'),size)
+        if ranges is None:
+            # Full file contents. WSGI server file wrapper will be used if available
+            self.streaming_content=open(filepath,'rb')
+            self['Content-Length']=size
+            return
+        if not self.has_header('Content-Encoding'):
+            # Byte ranges refer to file contents, so they must not be compressed by middlewares
+            self['Content-Encoding']='identity'
+        if not ranges:
+            self.status_code=416
+            self['Content-Range']='bytes */%d' % size
+            self['Content-Length']=0
+        elif len(ranges) == 1:
+            start,end=ranges[0]
+            self.status_code=206
+            self['Content-Range']='bytes %d-%d/%d' % (start,end,size)
+            self['Content-Length']=end - start + 1
+            self.streaming_content=self.iter_ranges(filepath,ranges)
+        else:
+            # Multiple ranges are sent as multipart content
+            boundary=uuid.uuid4().hex
+            content_type=self['Content-Type']
+            parts=[]
+            length=0
+            for start,end in ranges:
+                header=('\r\n--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n' % (boundary,content_type,start,end,size)).encode('ascii')
+                parts.append((header,start,end))
+                length+=len(header) + end - start + 1
+            footer=('\r\n--%s--\r\n' % boundary).encode('ascii')
+            self.status_code=206
+            self['Content-Type']='multipart/byteranges; boundary=%s' % boundary
+            self['Content-Length']=length + len(footer)
+            self.streaming_content=self.iter_ranges(filepath,parts,footer)
+
+    def is_range_valid(self,request,metadata):
+        """
+        Check If-Range header to know if range can be served
+        """
+        if_range=request.META.get('HTTP_IF_RANGE')
+        if if_range is None:
+            return True
+        if if_range.strip() == metadata.etag:
+            return True
+        return parse_http_date_safe(if_range) == metadata.mtime
+
+    def iter_ranges(self,filepath,ranges,footer=None):
+        """
+        Iterate over file ranges contents using a memory mapped file
+
+        Ranges are (start,end) tuples or (header,start,end) tuples for multipart contents
+        """
+        with open(filepath,'rb') as f:
+            filemap=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+            try:
+                for r in ranges:
+                    if len(r) == 3:
+                        header,start,end=r
+                        yield header
+                    else:
+                        start,end=r
+                    for offset in range(start,end + 1,self.block_size):
+                        yield filemap[offset:min(offset + self.block_size,end + 1)]
+            finally:
+                filemap.close()
+        if footer is not None:
+            yield footer
+
+def get_static_response(filepath,backend=settings.STATIC_SENDFILE_BACKEND,download_as=None,force_backend=False,extra_headers={},request=None,*args,**kwargs):
+    """
+    Get response for serving a static file
+
+    Files served from Django are streamed using DirectFileResponse. Files served by HTTP server
+    and not modified responses use StaticSendFileResponse, which has no streaming content.
+    See StaticSendFileResponse for parameters.
+    """
+    if backend=='direct' or (settings.DEBUG and not force_backend):
+        metadata=get_static_metadata(filepath)
+        encoded=get_encoded_file(filepath,metadata,request)[1]
+        if not is_file_not_modified(request,encoded):
+            return DirectFileResponse(filepath,download_as,extra_headers,request,*args,**kwargs)
+    return StaticSendFileResponse(filepath,backend,download_as,force_backend,extra_headers,request,*args,**kwargs)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Site tools buffered site log writer module
+===============================================
+
+.. module:: sitetools.logwriter
+    :platform: Django
+    :synopsis: Site tools buffered site log writer module
+.. moduleauthor:: (C) 2014 Oliver Gutiérrez
+"""
+
+# Python imports
+import os
+import time
+import atexit
+import threading
+import traceback
+
+# Django imports
+from django.db import close_old_connections
+from django.utils.six.moves import queue
+from django.conf import settings
+
+class BufferedLogWriter(object):
+    """
+    Site log writer that saves log entries in batches from a background thread
+
+    Entries are queued in a bounded queue and written using bulk_create every SITE_LOG_BATCH_SIZE
+    entries or SITE_LOG_FLUSH_INTERVAL milliseconds. If the queue is full, entries are saved
+    synchronously.
+    """
+    # Marker for stopping background thread
+    STOP = object()
+
+    def __init__(self):
+        """
+        Class initialization method
+        """
+        self._lock=threading.Lock()
+        self._queue=None
+        self._thread=None
+        self._pid=None
+        atexit.register(self.stop)
+
+    def _start(self):
+        """
+        Start background writer thread for current process
+        """
+        with self._lock:
+            # Forked processes do not inherit the background thread
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid=os.getpid()
+            self._queue=queue.Queue(settings.SITE_LOG_BUFFER_SIZE)
+            self._thread=threading.Thread(target=self._run,name='sitetools-logwriter')
+            self._thread.daemon=True
+            self._thread.start()
+
+    def write(self,log,mail_admins=False):
+        """
+        Queue a log entry for writing
+
+        :param log: Site log entry
+        :type log: SiteLog
+        :param mail_admins: Mail administrators once the entry has been written
+        :type mail_admins: Boolean
+        """
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            self._start()
+        try:
+            self._queue.put_nowait((log,mail_admins))
+        except queue.Full:
+            # Buffer is full. Write log entry synchronously
+            self._save([(log,mail_admins)])
+
+    def _run(self):
+        """
+        Background thread loop
+        """
+        interval=settings.SITE_LOG_FLUSH_INTERVAL / 1000.0
+        batch_size=settings.SITE_LOG_BATCH_SIZE
+        stopped=False
+        while not stopped:
+            batch=[]
+            deadline=time.time() + interval
+            while len(batch) < batch_size:
+                try:
+                    item=self._queue.get(timeout=max(deadline - time.time(),0.001))
+                except queue.Empty:
+                    break
+                if item is self.STOP:
+                    stopped=True
+                    break
+                batch.append(item)
+            if batch:
+                self._save(batch)
+                close_old_connections()
+
+    def _save(self,batch):
+        """
+        Save a batch of log entries and send pending administrators mails
+
+        If the batch can not be written at once, entries are saved one by one and those
+        failing are discarded
+        """
+        logs=[log for log,mail_admins in batch]
+        try:
+            logs[0].__class__.objects.bulk_create(logs)
+        except Exception:
+            traceback.print_exc()
+            saved=[]
+            for log,mail_admins in batch:
+                try:
+                    log.save()
+                except Exception:
+                    traceback.print_exc()
+                else:
+                    saved.append((log,mail_admins))
+            batch=saved
+        for log,mail_admins in batch:
+            if mail_admins:
+                log.notify_admins()
+
+    def flush(self):
+        """
+        Synchronously write all queued log entries
+        """
+        if self._queue is None:
+            return
+        batch=[]
+        while True:
+            try:
+                item=self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not self.STOP:
+                batch.append(item)
+        if batch:
+            self._save(batch)
+
+    def stop(self,timeout=5):
+        """
+        Stop background thread writing all queued log entries
+        """
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(self.STOP,timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        # Write entries left if thread did not finish in time
+        self.flush()
+
+# Default buffered site log writer
+sitelog_writer=BufferedLogWriter()
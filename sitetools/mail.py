@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Site tools mail dispatch module
+===============================================
+
+.. module:: sitetools.mail
+    :platform: Django
+    :synopsis: Site tools mail dispatch module
+.. moduleauthor:: (C) 2014 Oliver Gutiérrez
+"""
+
+# Python imports
+import os
+import time
+import atexit
+import socket
+import smtplib
+import threading
+import traceback
+
+# Django imports
+from django.core.mail import get_connection
+from django.utils.six.moves import queue
+from django.conf import settings
+
+# Errors caused by lost connections. Messages failing with them are retried with a new connection
+CONNECTION_ERRORS=(smtplib.SMTPServerDisconnected,socket.error)
+
+class MailDispatcher(object):
+    """
+    Mail dispatcher reusing an open connection for each thread
+
+    Messages can be sent synchronously or queued for background worker threads. Deliveries
+    failed by connection errors are retried once when sending synchronously and up to MAIL_RETRIES times from
+    background threads. Connections are closed after MAIL_IDLE_TIMEOUT seconds without
+    messages to send.
+    """
+    # Marker for stopping background threads
+    STOP = object()
+
+    def __init__(self):
+        """
+        Class initialization method
+        """
+        self._lock=threading.Lock()
+        self._local=threading.local()
+        self._queue=None
+        self._workers=[]
+        self._pid=None
+        atexit.register(self.stop)
+
+    def get_connection(self,backend=None):
+        """
+        Get current thread open connection
+
+        Connections unused for MAIL_IDLE_TIMEOUT seconds are closed and opened again
+        """
+        if backend is None:
+            backend=settings.MAIL_BACKEND
+        connections=getattr(self._local,'connections',None)
+        if connections is None or getattr(self._local,'pid',None) != os.getpid():
+            connections=self._local.connections={}
+            self._local.pid=os.getpid()
+        elif time.time() - getattr(self._local,'last_used',0) > settings.MAIL_IDLE_TIMEOUT:
+            self.close_connections()
+            connections=self._local.connections
+        connection=connections.get(backend)
+        if connection is None:
+            connection=connections[backend]=get_connection(backend)
+        self._local.last_used=time.time()
+        return connection
+
+    def close_connections(self):
+        """
+        Close current thread connections
+        """
+        for connection in getattr(self._local,'connections',{}).values():
+            try:
+                connection.close()
+            except Exception:
+                pass
+        self._local.connections={}
+
+    def deliver(self,messages,retries=1,fail_silently=False):
+        """
+        Send messages using current thread connection, retrying on connection errors
+
+        Messages are sent one by one over the connection, so only those not sent yet are
+        retried. First retry is done at once with a new connection, as the server may have
+        closed the previous one. Next ones wait MAIL_RETRY_DELAY seconds, doubled each time.
+        Messages failing for other reasons, like refused recipients, are not retried and
+        do not stop sending the rest. The first of those errors is raised at the end unless
+        fail_silently is True.
+
+        :returns: Number of sent messages
+        """
+        pending=list(messages)
+        sent=0
+        attempt=0
+        delay=settings.MAIL_RETRY_DELAY
+        error=None
+        while pending:
+            try:
+                connection=self.get_connection()
+                connection.open()
+                while pending:
+                    try:
+                        sent+=connection.send_messages(pending[:1]) or 0
+                    except CONNECTION_ERRORS:
+                        raise
+                    except Exception, e:
+                        # Message can not be sent. Skip it
+                        traceback.print_exc()
+                        if error is None:
+                            error=e
+                    pending.pop(0)
+            except Exception:
+                # Open a new connection for next attempt
+                self.close_connections()
+                if attempt >= retries:
+                    if fail_silently:
+                        return sent
+                    raise
+                if attempt > 0:
+                    time.sleep(delay)
+                    delay*=2
+                attempt+=1
+        if error is not None and not fail_silently:
+            raise error
+        return sent
+
+    def _start(self):
+        """
+        Start background worker threads for current process
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked processes do not inherit background threads
+                self._pid=os.getpid()
+                self._queue=queue.Queue(settings.MAIL_QUEUE_SIZE)
+                self._workers=[]
+            self._workers=[w for w in self._workers if w.is_alive()]
+            for i in range(settings.MAIL_WORKERS - len(self._workers)):
+                worker=threading.Thread(target=self._run,name='sitetools-mail')
+                worker.daemon=True
+                worker.start()
+                self._workers.append(worker)
+
+    def _run(self):
+        """
+        Background worker loop
+        """
+        while True:
+            try:
+                item=self._queue.get(timeout=settings.MAIL_IDLE_TIMEOUT)
+            except queue.Empty:
+                self.close_connections()
+                continue
+            if item is self.STOP:
+                break
+            try:
+                self.deliver(item,settings.MAIL_RETRIES,fail_silently=True)
+            except Exception:
+                traceback.print_exc()
+        self.close_connections()
+
+    def send(self,messages,background=None,fail_silently=False):
+        """
+        Send messages
+
+        :param messages: List of email messages
+        :param background: Queue messages for background sending. MAIL_BACKGROUND setting by default
+        :returns: Number of sent messages, or queued ones when sending in background
+        """
+        if background is None:
+            background=settings.MAIL_BACKGROUND
+        if not messages:
+            return 0
+        if not background:
+            return self.deliver(messages,fail_silently=fail_silently)
+        if self._pid != os.getpid() or len([w for w in self._workers if w.is_alive()]) < settings.MAIL_WORKERS:
+            self._start()
+        try:
+            self._queue.put_nowait(messages)
+        except queue.Full:
+            # Queue is full. Send messages synchronously
+            return self.deliver(messages,fail_silently=fail_silently)
+        return len(messages)
+
+    def stop(self,timeout=5):
+        """
+        Stop background threads sending all queued messages
+        """
+        if self._pid != os.getpid():
+            return
+        workers=[w for w in self._workers if w.is_alive()]
+        for worker in workers:
+            try:
+                self._queue.put(self.STOP,timeout=timeout)
+            except queue.Full:
+                break
+        for worker in workers:
+            worker.join(timeout)
+
+# Default mail dispatcher
+mail_dispatcher=MailDispatcher()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Site tools command for precompressing static files
+===============================================
+
+.. module:: sitetools.management.commands.compressstatic
+    :platform: Django
+    :synopsis: Site tools command for precompressing static files
+.. moduleauthor:: (C) 2015 Oliver Gutiérrez
+"""
+
+# Python imports
+import os
+import gzip
+import shutil
+import mimetypes
+import warnings
+import multiprocessing
+
+# Try to import brotli module
+try:
+    import brotli
+except ImportError:
+    warnings.warn('Brotli module not available. Static files will not be compressed using brotli',ImportWarning)
+    brotli = None
+
+# Django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import ugettext, ugettext_lazy as _
+from django.conf import settings
+
+# Mime types worth compressing besides text ones
+COMPRESSIBLE_TYPES = (
+    'application/javascript',
+    'application/x-javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+    'image/x-icon',
+    'image/vnd.microsoft.icon',
+    'application/vnd.ms-fontobject',
+    'application/x-font-ttf',
+    'font/ttf',
+    'font/otf',
+)
+
+
+def is_compressible(filename):
+    """
+    Check if a file is worth compressing by its mime type
+    """
+    content_type = mimetypes.guess_type(filename)[0]
+    if content_type is None:
+        return False
+    return content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES
+
+
+def compress_file(args):
+    """
+    Compress a file with given encodings skipping those with an up to date compressed file
+
+    :returns: List of written compressed files
+    """
+    filepath, encodings, min_size = args
+    written = []
+    stat = os.stat(filepath)
+    if stat.st_size < min_size:
+        return written
+    for encoding, extension in encodings:
+        destpath = filepath + extension
+        if os.path.exists(destpath) and os.path.getmtime(destpath) >= stat.st_mtime:
+            continue
+        if encoding == 'gzip':
+            with open(filepath, 'rb') as src:
+                with open(destpath, 'wb') as dst:
+                    gz = gzip.GzipFile(os.path.basename(filepath), 'wb', 9, dst, stat.st_mtime)
+                    try:
+                        shutil.copyfileobj(src, gz)
+                    finally:
+                        gz.close()
+        elif encoding == 'br' and brotli is not None:
+            with open(filepath, 'rb') as src:
+                data = brotli.compress(src.read())
+            with open(destpath, 'wb') as dst:
+                dst.write(data)
+        else:
+            continue
+        # Remove compressed versions that are not smaller than original file
+        if os.path.getsize(destpath) >= stat.st_size:
+            os.remove(destpath)
+        else:
+            written.append(destpath)
+    return written
+
+
+class Command(BaseCommand):
+    help = _('Precompress static files for serving them to clients accepting compressed contents')
+
+    def add_arguments(self, parser):
+        # Named (optional) arguments
+        parser.add_argument(
+            '--root',
+            dest='root',
+            default=None,
+            help=_('Directory to compress (STATIC_ROOT by default)')
+        )
+        parser.add_argument(
+            '--processes',
+            dest='processes',
+            type=int,
+            default=None,
+            help=_('Number of parallel processes (number of CPUs by default)')
+        )
+        parser.add_argument(
+            '--min-size',
+            dest='min_size',
+            type=int,
+            default=256,
+            help=_('Minimum file size in bytes for compressing it')
+        )
+
+    def handle(self, *args, **options):
+        """
+        Command handling
+        """
+        root = options['root'] or settings.STATIC_ROOT
+        if not root or not os.path.isdir(root):
+            raise CommandError(ugettext('Invalid static files directory: %s') % root)
+        encodings = settings.STATIC_PRECOMPRESSED_ENCODINGS
+        extensions = tuple([extension for encoding, extension in encodings])
+        # Collect files to compress
+        tasks = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(extensions) or not is_compressible(filename):
+                    continue
+                tasks.append((os.path.join(dirpath, filename), encodings, options['min_size']))
+        # Compress files in parallel
+        pool = multiprocessing.Pool(options['processes'] or multiprocessing.cpu_count())
+        try:
+            count = 0
+            for written in pool.imap_unordered(compress_file, tasks, 16):
+                for destpath in written:
+                    count += 1
+                    if options['verbosity'] > 1:
+                        self.stdout.write(destpath)
+        finally:
+            pool.close()
+            pool.join()
+        self.stdout.write(ugettext('%d compressed files written') % count)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Site tools command for generating hashed static files
+===============================================
+
+.. module:: sitetools.management.commands.hashstatic
+    :platform: Django
+    :synopsis: Site tools command for generating hashed static files
+.. moduleauthor:: (C) 2015 Oliver Gutiérrez
+"""
+
+# Python imports
+import os
+import json
+import shutil
+import hashlib
+
+# Django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import ugettext, ugettext_lazy as _
+from django.conf import settings
+
+
+def file_hash(filepath, length):
+    """
+    Get a file contents MD5 hash truncated to given length
+    """
+    md5 = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            md5.update(chunk)
+    return md5.hexdigest()[:length]
+
+
+class Command(BaseCommand):
+    help = _('Copy static files to names containing their contents hash and write static files manifest')
+
+    def add_arguments(self, parser):
+        # Named (optional) arguments
+        parser.add_argument(
+            '--root',
+            dest='root',
+            default=None,
+            help=_('Static files directory (STATIC_ROOT by default)')
+        )
+        parser.add_argument(
+            '--hash-length',
+            dest='hash_length',
+            type=int,
+            default=12,
+            help=_('Number of hash characters added to file names')
+        )
+
+    def handle(self, *args, **options):
+        """
+        Command handling
+        """
+        root = options['root'] or settings.STATIC_ROOT
+        if not root or not os.path.isdir(root):
+            raise CommandError(ugettext('Invalid static files directory: %s') % root)
+        manifestpath = os.path.join(root, settings.STATIC_MANIFEST_NAME)
+        # Load previous manifest for skipping previously hashed files
+        hashed = set()
+        if os.path.exists(manifestpath):
+            with open(manifestpath) as f:
+                manifest = json.load(f)
+            hashed.update(manifest.get('paths', {}).values())
+            hashed.update(manifest.get('hashed', []))
+        extensions = tuple([extension for encoding, extension in settings.STATIC_PRECOMPRESSED_ENCODINGS])
+        paths = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                filepath = os.path.join(dirpath, filename)
+                name = os.path.relpath(filepath, root).replace(os.sep, '/')
+                if name in hashed or filepath == manifestpath or (extensions and filename.endswith(extensions)):
+                    continue
+                base, ext = os.path.splitext(name)
+                hashedname = '%s.%s%s' % (base, file_hash(filepath, options['hash_length']), ext)
+                hashedpath = os.path.join(root, hashedname)
+                if not os.path.exists(hashedpath):
+                    shutil.copy2(filepath, hashedpath)
+                    if options['verbosity'] > 1:
+                        self.stdout.write(hashedname)
+                paths[name] = hashedname
+        # Previous hashed files are kept for pages still referencing them
+        hashed.update(paths.values())
+        # Write manifest atomically
+        tmppath = manifestpath + '.tmp'
+        with open(tmppath, 'w') as f:
+            json.dump({'version': 1, 'paths': paths, 'hashed': sorted(hashed)}, f, indent=1, sort_keys=True)
+        os.rename(tmppath, manifestpath)
+        self.stdout.write(ugettext('%d static files in manifest') % len(paths))
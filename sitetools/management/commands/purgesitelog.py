@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Site tools command for purging old site log entries
+===============================================
+
+.. module:: sitetools.management.commands.purgesitelog
+    :platform: Django
+    :synopsis: Site tools command for purging old site log entries
+.. moduleauthor:: (C) 2015 Oliver Gutiérrez
+"""
+
+# Python imports
+import os
+import gzip
+import json
+import time
+import datetime
+
+# Django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import six, timezone
+from django.utils.translation import ugettext, ugettext_lazy as _
+from django.conf import settings
+
+# Application imports
+from sitetools.models import SiteLog
+
+
+class Command(BaseCommand):
+    help = _('Delete site log entries older than a number of days in small batches')
+
+    def add_arguments(self, parser):
+        # Named (optional) arguments
+        parser.add_argument(
+            '--days',
+            dest='days',
+            type=int,
+            default=None,
+            help=_('Delete entries older than given days (SITE_LOG_RETENTION_DAYS setting by default)')
+        )
+        parser.add_argument(
+            '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=1000,
+            help=_('Number of entries deleted in each batch')
+        )
+        parser.add_argument(
+            '--sleep',
+            dest='sleep',
+            type=float,
+            default=0,
+            help=_('Seconds to wait between batches')
+        )
+        parser.add_argument(
+            '--archive',
+            dest='archive',
+            default=None,
+            help=_('Directory where deleted entries are archived as gzip compressed JSON lines files')
+        )
+
+    def handle(self, *args, **options):
+        """
+        Command handling
+        """
+        days = options['days']
+        if days is None:
+            days = settings.SITE_LOG_RETENTION_DAYS
+        if days is None:
+            raise CommandError(ugettext('No retention days specified'))
+        cutoff = timezone.now() - datetime.timedelta(days=days)
+        qs = SiteLog.objects.filter(timestamp__lt=cutoff).order_by('pk')
+        archive = None
+        if options['archive']:
+            if not os.path.isdir(options['archive']):
+                os.makedirs(options['archive'])
+            filename = 'sitelog-%s.jsonl.gz' % timezone.now().strftime('%Y%m%d%H%M%S')
+            archive = gzip.open(os.path.join(options['archive'], filename), 'wb')
+        count = 0
+        last = 0
+        try:
+            while True:
+                # Each batch is deleted in its own short statement using primary keys
+                batch = qs.filter(pk__gt=last)[:options['batch_size']]
+                if archive is not None:
+                    rows = list(batch.values())
+                    ids = [row['id'] for row in rows]
+                    for row in rows:
+                        # Encoded fields are archived with their raw database value
+                        if row['data'] is not None:
+                            row['data'] = six.text_type(row['data'])
+                        archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+                else:
+                    ids = list(batch.values_list('pk', flat=True))
+                if not ids:
+                    break
+                SiteLog.objects.filter(pk__in=ids).delete()
+                count += len(ids)
+                last = ids[-1]
+                if options['verbosity'] > 1:
+                    self.stdout.write(ugettext('%d entries deleted') % count)
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+        finally:
+            if archive is not None:
+                archive.close()
+        self.stdout.write(ugettext('%d site log entries deleted') % count)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Site tools command for rendering sitemaps to disk
+===============================================
+
+.. module:: sitetools.management.commands.rendersitemaps
+    :platform: Django
+    :synopsis: Site tools command for rendering sitemaps to disk
+.. moduleauthor:: (C) 2015 Oliver Gutiérrez
+"""
+
+# Python imports
+import os
+import gzip
+
+# Django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.sites.models import Site
+from django.utils.module_loading import import_string
+from django.utils.translation import ugettext, ugettext_lazy as _
+from django.conf import settings
+
+# Application imports
+from sitetools.sitemaps import get_sitemap, iter_sitemap_index
+
+
+def write_parts(filepath, parts, compress=False):
+    """
+    Write document parts to a file atomically, optionally compressed with gzip
+    """
+    tmppath = filepath + '.tmp'
+    if compress:
+        f = gzip.open(tmppath, 'wb', 9)
+    else:
+        f = open(tmppath, 'wb')
+    try:
+        for part in parts:
+            f.write(part)
+    finally:
+        f.close()
+    os.rename(tmppath, filepath)
+
+
+class Command(BaseCommand):
+    help = _('Render sitemaps for each site to gzip compressed files')
+
+    def add_arguments(self, parser):
+        # Named (optional) arguments
+        parser.add_argument(
+            '--sitemaps',
+            dest='sitemaps',
+            default=None,
+            help=_('Python path to sitemaps dictionary (SITEMAPS setting by default)')
+        )
+        parser.add_argument(
+            '--output',
+            dest='output',
+            default=None,
+            help=_('Output directory (SITEMAP_ROOT setting by default). Files are written to a directory for each site domain')
+        )
+        parser.add_argument(
+            '--domain',
+            action='append',
+            dest='domains',
+            default=[],
+            help=_('Render sitemaps only for given site domain. Can be used several times')
+        )
+        parser.add_argument(
+            '--secure',
+            action='store_true',
+            dest='secure',
+            default=False,
+            help=_('Use HTTPS URLs')
+        )
+
+    def handle(self, *args, **options):
+        """
+        Command handling
+        """
+        path = options['sitemaps'] or settings.SITEMAPS
+        output = options['output'] or settings.SITEMAP_ROOT
+        if not path:
+            raise CommandError(ugettext('No sitemaps dictionary specified'))
+        if not output:
+            raise CommandError(ugettext('No output directory specified'))
+        sitemaps = import_string(path)
+        sites = Site.objects.all()
+        if options['domains']:
+            sites = sites.filter(domain__in=options['domains'])
+
+        def section_url(section, page):
+            return '%ssitemap-%s-%d.xml.gz' % (settings.SITEMAP_URL, section, page)
+
+        for site in sites:
+            sitedir = os.path.join(output, site.domain)
+            if not os.path.isdir(sitedir):
+                os.makedirs(sitedir)
+            for section in sorted(sitemaps.keys()):
+                sitemap = get_sitemap(sitemaps, section)
+                for page in range(1, sitemap.get_num_pages(site) + 1):
+                    filename = 'sitemap-%s-%d.xml.gz' % (section, page)
+                    write_parts(os.path.join(sitedir, filename), sitemap.iter_xml(site, page, options['secure']), True)
+                    if options['verbosity'] > 1:
+                        self.stdout.write(os.path.join(site.domain, filename))
+            write_parts(os.path.join(sitedir, 'sitemap.xml'),
+                        iter_sitemap_index(sitemaps, site, options['secure'], section_url))
+            self.stdout.write(ugettext('Sitemaps rendered for %s') % site.domain)
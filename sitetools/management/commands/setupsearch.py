@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Site tools command for setting up full text search indexes
+===============================================
+
+.. module:: sitetools.management.commands.setupsearch
+    :platform: Django
+    :synopsis: Site tools command for setting up full text search indexes
+.. moduleauthor:: (C) 2015 Oliver Gutiérrez
+"""
+
+# Django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import ugettext, ugettext_lazy as _
+
+# Application imports
+from sitetools.search import get_search_backends
+
+
+class Command(BaseCommand):
+    help = _('Create full text search indexes for models registered for searching')
+
+    def add_arguments(self, parser):
+        # Named (optional) arguments
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            dest='rebuild',
+            default=False,
+            help=_('Rebuild index contents')
+        )
+
+    def handle(self, *args, **options):
+        """
+        Command handling
+        """
+        backends = get_search_backends()
+        if not backends:
+            raise CommandError(ugettext('No search backend configured'))
+        for backend in backends:
+            backend.setup()
+            if options['rebuild']:
+                backend.rebuild()
+            self.stdout.write(ugettext('Search index ready for %s') % backend.model._meta.label)
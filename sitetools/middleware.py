@@ -9,19 +9,17 @@
 .. moduleauthor:: (C) 2014 Oliver Gutiérrez
 """
 
-# Python imports
-import re
-
 # Django imports
 from django.conf import settings, urls
 from django.core import urlresolvers
 from django.shortcuts import redirect
 from django.http import HttpResponsePermanentRedirect
 from django.middleware.locale import LocaleMiddleware
+from django.utils.functional import SimpleLazyObject
 
 # Application imports
-from sitetools.models import LegalDocument
-from sitetools.utils import match_any, get_site_from_request, get_client_ip, build_site_url
+from sitetools.models import LegalDocument, LegalDocumentAcceptance, SiteVarSnapshot
+from sitetools.utils import CompiledURLMatcher, get_site_from_request, get_client_ip, build_site_url
 
 # Add 503 handler to django urls module
 urls.handler503 = 'sitetools.views.service_unavailable'
@@ -30,6 +28,8 @@ urls.__all__.append('handler503')
 class CurrentSiteMiddleware(object):
     """
     Enhanced Middleware that sets `site` attribute to request object by checking host against the Site model domains
+
+    It also sets a lazy `sitevars` attribute with the site variables snapshot
     """
     def process_request(self, request):
         """
@@ -37,6 +37,7 @@ class CurrentSiteMiddleware(object):
         """
         site = get_site_from_request(request)
         request.site = site
+        request.sitevars = SimpleLazyObject(lambda: SiteVarSnapshot.get_site_snapshot(site))
 
 class MaintenanceMiddleware(object):
     """
@@ -44,7 +45,7 @@ class MaintenanceMiddleware(object):
     """
     
     # Compile maintenance whitelist URLs
-    _MAINTENANCE_WHITELIST = tuple([re.compile(u) for u in settings.MAINTENANCE_URL_WHITELIST]) 
+    _MAINTENANCE_WHITELIST = CompiledURLMatcher(settings.MAINTENANCE_URL_WHITELIST)
     
     def process_request(self, request):
         """
@@ -69,7 +70,7 @@ class MaintenanceMiddleware(object):
                 is_staff=False
             if get_client_ip(request) not in settings.INTERNAL_IPS and not is_staff:
                 # Check if current view is whitelisted
-                if not match_any(request.path_info, self._MAINTENANCE_WHITELIST):
+                if not self._MAINTENANCE_WHITELIST.match(request.path_info):
                     # Return 503 handler response
                     resolver = urlresolvers.get_resolver(None)
                     callback, param_dict = resolver._resolve_special('503')
@@ -81,10 +82,10 @@ class SecureURLMiddleware(object):
     """
 
     # Compile forced secure URLs list
-    _forced_secure_urls = tuple([re.compile(u) for u in settings.FORCED_SECURE_URLS])
+    _forced_secure_urls = CompiledURLMatcher(settings.FORCED_SECURE_URLS)
     
     # Compile secure URLs list
-    _allowed_secure_urls = _forced_secure_urls + tuple([re.compile(u) for u in settings.ALLOWED_SECURE_URLS])
+    _allowed_secure_urls = CompiledURLMatcher(tuple(settings.FORCED_SECURE_URLS) + tuple(settings.ALLOWED_SECURE_URLS))
     
     def process_request(self, request):
         """
@@ -100,11 +101,11 @@ class SecureURLMiddleware(object):
             # Only check security if debug is disabled
             if not request.is_secure():
                 # Force HTTPS for forced secure paths
-                if match_any(request.path_info, self._forced_secure_urls):
+                if self._forced_secure_urls.match(request.path_info):
                     return redirect(build_site_url(site,request.get_full_path(),secure=True))
             else:
                 # Allow secure paths only for allowed ones
-                if not match_any(request.path_info, self._allowed_secure_urls):
+                if not self._allowed_secure_urls.match(request.path_info):
                     return redirect(build_site_url(site,request.get_full_path(),secure=False))
 
 class CaseInsensitiveURLMiddleware(object):
@@ -113,20 +114,23 @@ class CaseInsensitiveURLMiddleware(object):
     """
     
     # Compile case sensitive paths
-    _case_sensitive_paths = tuple([re.compile(u) for u in settings.CASE_SENSITIVE_URLS])
+    _case_sensitive_paths = CompiledURLMatcher(settings.CASE_SENSITIVE_URLS)
     
     def process_request(self, request):
         """
         Request processing method
         """
         lpath=request.path_info.lower()
-        if request.path_info != lpath and not match_any(request.path_info, self._case_sensitive_paths):
+        if request.path_info != lpath and not self._case_sensitive_paths.match(request.path_info):
             return redirect(lpath,permanent=False)
         return None
 
 class LegalMiddleware(object):
     """
     Legal documents middleware class
+
+    Forced document version is cached and accepted version is stored in session, so users that
+    already accepted it are not checked again until a new version applies
     """
     def process_request(self, request):
         """
@@ -140,12 +144,21 @@ class LegalMiddleware(object):
             for path in settings.FORCE_LEGAL_ACCEPTANCE_WHITELIST_URLS:
                     if request.path.startswith(path):
                         return None
-            # Check if user is logged in and accessing other URL different to legal acceptance 
-            if request.user.is_authenticated() and not request.path.startswith(urlresolvers.reverse('legal_document_acceptance')):
-                document=LegalDocument.get_document_version(settings.FORCED_LEGAL_DOCUMENT, settings.FORCED_LEGAL_DOCUMENT_VERSION)
-                if document is not None:
+            # Check if user is logged in
+            if request.user.is_authenticated():
+                document=LegalDocument.get_cached_document_version(settings.FORCED_LEGAL_DOCUMENT, settings.FORCED_LEGAL_DOCUMENT_VERSION)
+                if document is None:
+                    return None
+                # Check if user already accepted current version in this session
+                accepted='%s:%s' % (request.user.pk,document.pk)
+                if request.session.get(LegalDocumentAcceptance.SESSION_KEY) == accepted:
+                    return None
+                # Check user is accessing other URL different to legal acceptance
+                if not request.path.startswith(urlresolvers.reverse('legal_document_acceptance')):
                     # Check if current user accepted the document
-                    if document.accepted_by_user(request.user) is None:
+                    if document.accepted_by_user(request.user) is not None:
+                        request.session[LegalDocumentAcceptance.SESSION_KEY]=accepted
+                    else:
                         # Redirect to acceptance page
                         if settings.FORCED_LEGAL_DOCUMENT is not None:
                             if settings.FORCED_LEGAL_DOCUMENT_VERSION is not None:
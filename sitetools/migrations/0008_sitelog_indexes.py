@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sitetools', '0007_auto_20160629_0016'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sitelog',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, help_text='Creation date', verbose_name='Created'),
+        ),
+        migrations.AlterIndexTogether(
+            name='sitelog',
+            index_together=set([('site', 'timestamp'), ('tag', 'level', 'timestamp')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sitetools', '0008_sitelog_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sitelog',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text='Creation date', verbose_name='Created'),
+        ),
+    ]
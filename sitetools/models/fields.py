@@ -9,18 +9,20 @@ Site tools model fields
 .. moduleauthor:: (C) 2014 Oliver Gutiérrez
 """
 # Python imports
-import json
 import pytz
+from importlib import import_module
 
 # Django imports
 from django.db import models
 from django.conf import settings
+from django.utils import six
+from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 
 # Application imports
 from sitetools import enums
 from sitetools import validators
-from sitetools.forms import LocationFormField, TinyMCEField, VectorFormField
+from sitetools.forms import LocationFormField, TinyMCEField, VectorFormField, JSONFormField
 
 TIMEZONE_CHOICES = [(x, x) for x in pytz.all_timezones]
 
@@ -126,9 +128,54 @@ class CodeField(models.TextField):
         return super(CodeField, self).formfield(**kwargs)
 
 
+class EncodedValue(six.text_type):
+    """
+    Encoded field value loaded from database and not decoded yet
+
+    It is the raw database string, so values() and values_list() querysets return plain strings.
+    Model instances decode it on first access.
+    """
+    __slots__ = ()
+
+
+class EncodedFieldDescriptor(object):
+    """
+    Encoded field descriptor that decodes database values on first access
+    """
+    def __init__(self, field):
+        """
+        Class initialization method
+        """
+        self.field = field
+
+    def __get__(self, instance, owner):
+        """
+        Get decoded value
+        """
+        if instance is None:
+            return self
+        if self.field.attname not in instance.__dict__:
+            # Deferred field
+            instance.refresh_from_db(fields=[self.field.attname])
+        value = instance.__dict__.get(self.field.attname)
+        if isinstance(value, EncodedValue):
+            value = self.field.decodecb(six.text_type(value))
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        """
+        Set value
+        """
+        instance.__dict__[self.field.attname] = value
+
+
 class EncodedField(models.TextField):
     """
     Encoded data field
+
+    Database values are decoded on first access and saved again without encoding if they
+    have not been accessed
     """
     description = _('Encoded data field')
 
@@ -151,18 +198,60 @@ class EncodedField(models.TextField):
         """
         raise NotImplementedError()
 
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        """
+        Set lazy decoding descriptor for this field
+        """
+        super(EncodedField, self).contribute_to_class(cls, name, *args, **kwargs)
+        setattr(cls, self.name, EncodedFieldDescriptor(self))
+
+    def from_db_value(self, value, expression, connection, context):
+        """
+        Database value loading method. Decoding is delayed until value is accessed on a model instance
+        """
+        if value is None:
+            return None
+        return EncodedValue(force_text(value))
+
+    def pre_save(self, model_instance, add):
+        """
+        Get value to be saved without decoding it
+        """
+        if self.attname not in model_instance.__dict__:
+            return getattr(model_instance, self.attname)
+        return model_instance.__dict__[self.attname]
+
     def to_python(self, value):
         """
         Python object casting method
         """
+        if isinstance(value, EncodedValue):
+            value = six.text_type(value)
         return self.decodecb(value)
 
     def get_prep_value(self, value):
         """
         DB object casting method
         """
+        if isinstance(value, EncodedValue):
+            return six.text_type(value)
         return self.encodecb(value)
 
+    def value_to_string(self, obj):
+        """
+        Serialization method. Values are serialized encoded
+        """
+        return self.get_prep_value(self.value_from_object(obj))
+
+
+def get_json_backend():
+    """
+    Get JSON encoding module set in JSONFIELD_BACKEND setting
+
+    Any module with json compatible dumps and loads functions can be used (simplejson, ujson, etc.)
+    """
+    return import_module(settings.JSONFIELD_BACKEND)
+
 
 class JSONField(EncodedField):
     """
@@ -177,13 +266,18 @@ class JSONField(EncodedField):
         Initialization method
         """
         kwargs.setdefault('default', None)
-        super(JSONField, self).__init__(encoder=json.dumps, decoder=self.decode_json, *args, **kwargs)
+        self.backend = get_json_backend()
+        super(JSONField, self).__init__(encoder=self.backend.dumps, decoder=self.decode_json, *args, **kwargs)
 
     def formfield(self, **kwargs):
         """
         Form field method overload
         """
         #kwargs.setdefault('form_class', AceEditorField)
+        if 'form_class' not in kwargs:
+            # Decoded values are edited as JSON
+            kwargs['form_class'] = JSONFormField
+            kwargs['encoder'] = self.backend.dumps
         return super(JSONField, self).formfield(**kwargs)
 
     def decode_json(self, value):
@@ -197,10 +291,10 @@ class JSONField(EncodedField):
         if isinstance(value, (list, dict)):
             return value
         try:
-            return json.loads(value)
+            return self.backend.loads(value)
         except:
             # Encode current value as JSON and return it
-            return json.dumps(value)
+            return self.backend.dumps(value)
 
 
 class LocationField(JSONField):
@@ -13,11 +13,13 @@ Site tools models module
 import sys
 import traceback
 import json
+import hashlib
 
 # Django imports
 from django.db import models
 from django.contrib.sites.models import Site
 from django.utils.translation import ugettext,ugettext_lazy as _
+from django.utils import timezone
 from django.core.mail import mail_admins as django_mail_admins
 from django.core.exceptions import ValidationError
 from django.template import Template, Context, RequestContext
@@ -25,10 +27,27 @@ from django.template.loader import render_to_string
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 # Applications imports
-from sitetools.utils import get_site_from_request
+from sitetools.utils import get_site_from_request, site_cache
 from sitetools.models.fields import CountryField, LanguageField, JSONField
+from sitetools.cache import LocalCache
+from sitetools.logwriter import sitelog_writer
+from sitetools import search
+
+# Site variables snapshots cache by site information identifier
+sitevars_cache=LocalCache('sitevars')
+
+# Legal document versions cache by document identifiers
+legal_cache=LocalCache('legal')
+
+# Compiled database templates cache by slug
+dbtemplates_cache=LocalCache('dbtemplates',maxsize=settings.DBTEMPLATE_CACHE_SIZE)
+
+# Robots contents cache by site domain
+robots_cache=LocalCache('robots')
 
 class SiteInfo(models.Model):
     """
@@ -48,24 +67,23 @@ class SiteInfo(models.Model):
     active=models.BooleanField(_('Active'),default=False,
         help_text=_('Specifies if this site is currently active'))
 
+    def get_snapshot(self):
+        """
+        Get cached snapshot of all site variables
+        """
+        return SiteVarSnapshot.get_snapshot(self.pk)
+
     def get_vars(self,varnames=None):
         """
         Get all site variables in a dictionary
         """
-        varlist=SiteVar.objects.filter(site=self)
-        if varnames is not None:
-            varlist=varlist.filter(name__in=varnames)
-        data={}
-        for var in varlist:
-            data[var.name]=var.get_value()
-        return data
+        return self.get_snapshot().get_vars(varnames)
 
     def get_var(self,name,default=None):
         """
         Get a variable value for this site
         """
-        var=self.get_vars([name])
-        return var.get(name,default)
+        return self.get_snapshot().get(name,default)
 
     def __unicode__(self):
         """
@@ -148,6 +166,74 @@ class SiteVar(models.Model):
         """
         return self.name
 
+class SiteVarSnapshot(object):
+    """
+    Site variables values loaded with a single query and already converted to their types
+
+    Values are shared between all snapshot users, so they must not be modified
+    """
+    def __init__(self,siteinfo_id):
+        """
+        Class initialization method
+        """
+        self.siteinfo_id=siteinfo_id
+        self.values={}
+        if siteinfo_id is None:
+            return
+        for var in SiteVar.objects.filter(site_id=siteinfo_id):
+            try:
+                self.values[var.name]=var.get_value()
+            except (ValueError,TypeError):
+                # Skip variables with invalid values
+                pass
+
+    @staticmethod
+    def get_snapshot(siteinfo_id):
+        """
+        Get site variables snapshot from cache or load it if not cached
+        """
+        snapshot=sitevars_cache.get(siteinfo_id)
+        if snapshot is None:
+            snapshot=SiteVarSnapshot(siteinfo_id)
+            sitevars_cache.set(siteinfo_id,snapshot)
+        return snapshot
+
+    @staticmethod
+    def get_site_snapshot(site):
+        """
+        Get site variables snapshot for a site. Sites without information have no variables
+        """
+        try:
+            return site.siteinfo.get_snapshot()
+        except SiteInfo.DoesNotExist:
+            return SiteVarSnapshot(None)
+
+    def get(self,name,default=None):
+        """
+        Get a variable value
+        """
+        return self.values.get(name,default)
+
+    def get_vars(self,varnames=None):
+        """
+        Get variables in a dictionary
+        """
+        if varnames is None:
+            return dict(self.values)
+        return dict([(name,self.values[name]) for name in varnames if name in self.values])
+
+    def __getitem__(self,name):
+        """
+        Get a variable value
+        """
+        return self.values[name]
+
+    def __contains__(self,name):
+        """
+        Check if a variable is defined
+        """
+        return name in self.values
+
 class SiteLog(models.Model):
     """
     Web site log model
@@ -172,8 +258,12 @@ class SiteLog(models.Model):
         """
         verbose_name=_('Site log')
         verbose_name_plural=_('Site logs')
+        index_together=(
+            ('site','timestamp'),
+            ('tag','level','timestamp'),
+        )
     
-    timestamp=models.DateTimeField(_('Created'),auto_now_add=True,
+    timestamp=models.DateTimeField(_('Created'),default=timezone.now,db_index=True,
         help_text=_('Creation date'))
     site=models.ForeignKey(Site,verbose_name=_('Site'),blank=True, null=True,
         help_text=_('Associated website'))
@@ -199,6 +289,9 @@ class SiteLog(models.Model):
     def log(tag,message,data=None,level=INFO,content_object=None,request=None,ip=None,user=None,site=None,mail_admins=False,callback=None,**kwargs):
         """
         Logs a message into site log
+
+        If SITE_LOG_BUFFERED is enabled, the log entry is written and administrators mailed
+        from a background thread, so the returned log object is not saved yet
         """
         # Set IP value
         if ip is None:
@@ -236,14 +329,17 @@ class SiteLog(models.Model):
         if len(message) > 200:
             message=message[:200]
             data='%s\n%s' % (message,data)
-        log=SiteLog(tag=tag,message=u'%s' % message,level=level,data=data,ip=ip,user=user,site=site)
+        log=SiteLog(timestamp=timezone.now(),tag=tag,message=u'%s' % message,level=level,data=data,ip=ip,user=user,site=site)
         log.content_object=content_object
-        log.save()
-        
+
         # Mail admins if specified or needed
-        if mail_admins or log.level <= settings.SITE_LOG_MAIL_ADMINS_LEVEL:
-            body=render_to_string('sitelog/mail_admins.html', {'log': log})
-            django_mail_admins(message,body,fail_silently=True)
+        mail_admins=mail_admins or log.level <= settings.SITE_LOG_MAIL_ADMINS_LEVEL
+        if settings.SITE_LOG_BUFFERED:
+            sitelog_writer.write(log,mail_admins)
+        else:
+            log.save()
+            if mail_admins:
+                log.notify_admins()
 
         # Callback execution
         if callback is not None:
@@ -252,6 +348,13 @@ class SiteLog(models.Model):
         # Return log object
         return log
 
+    def notify_admins(self):
+        """
+        Mail this log entry to administrators
+        """
+        body=render_to_string('sitelog/mail_admins.html', {'log': self})
+        django_mail_admins(self.message,body,fail_silently=True)
+
     def __unicode__(self):
         """
         Model unicode representation
@@ -266,10 +369,7 @@ class LegalDocumentVersionManager(models.Manager):
         """
         Get last document version
         """
-        qs=self.get_queryset().filter(document=document).order_by('-date')
-        if qs.count() > 0:
-            return qs[0]
-        return None
+        return self.get_queryset().filter(document=document).order_by('-date').first()
 
 class LegalDocument(models.Model):
     """
@@ -326,6 +426,21 @@ class LegalDocument(models.Model):
 	       document=document.get_latest()
         return document
 
+    @staticmethod
+    def get_cached_document_version(docid=None,version=None,country=None):
+        """
+        Get document version like get_document_version using a cache cleared when documents change
+        """
+        key=(docid,version,country)
+        document=legal_cache.get(key,LocalCache.MISSING)
+        if document is LocalCache.MISSING:
+            try:
+                document=LegalDocument.get_document_version(docid,version,country)
+            except LegalDocumentVersion.DoesNotExist:
+                document=None
+            legal_cache.set(key,document)
+        return document
+
     def __unicode__(self):
         """
         Model unicode representation
@@ -361,11 +476,7 @@ class LegalDocumentVersion(models.Model):
         """
         Check if this legal document version has been accepted by the user
         """
-        acceptances=LegalDocumentAcceptance.objects.filter(documentversion=self,user=user)
-        if acceptances.count() > 0:
-            return acceptances[0]
-        else:
-            return None
+        return LegalDocumentAcceptance.objects.filter(documentversion=self,user=user).first()
 
     def __unicode__(self):
         """
@@ -377,6 +488,9 @@ class LegalDocumentAcceptance(models.Model):
     """
     Legal document acceptance by user accounts
     """
+    # Session key for storing last accepted forced document version
+    SESSION_KEY='legal_accepted_version'
+
     class Meta:
         """
         Metadata for this model
@@ -455,11 +569,33 @@ class DBTemplate(models.Model):
     content=models.TextField(_('Content'),blank=True,null=True,
         help_text=_('Template contents'))
 
-    def get_template(self):
+    def get_template(self,engine=None,origin=None):
         """
         Returns Django template object
+
+        Compiled templates are cached by slug and checked against current contents hash
+        """
+        content=self.content or u''
+        checksum=hashlib.md5(content.encode('utf-8')).hexdigest()
+        cached=dbtemplates_cache.get(self.slug)
+        if cached is not None and cached[0] == checksum:
+            return cached[1]
+        if engine is None:
+            template=Template(content)
+        else:
+            template=Template(content,origin,self.slug,engine)
+        dbtemplates_cache.set(self.slug,(checksum,template))
+        return template
+
+    @staticmethod
+    def get_cached_template(slug,engine=None,origin=None):
+        """
+        Returns Django template object for a slug, only querying database if not cached
         """
-        return Template(self.content)
+        cached=dbtemplates_cache.get(slug)
+        if cached is not None:
+            return cached[1]
+        return DBTemplate.objects.get(slug=slug).get_template(engine,origin)
 
     def render(self,request=None,context={}):
         """
@@ -479,3 +615,45 @@ class DBTemplate(models.Model):
         Return model unicode representation
         """
         return self.slug
+
+# Signal handlers
+@receiver([post_save,post_delete],sender=Site)
+@receiver([post_save,post_delete],sender=SiteInfo)
+def clear_site_cache(sender,**kwargs):
+    """
+    Clear site resolution cache when sites change
+    """
+    site_cache.clear()
+
+@receiver([post_save,post_delete],sender=SiteVar)
+def clear_sitevars_cache(sender,**kwargs):
+    """
+    Clear site variables snapshots when variables change
+    """
+    sitevars_cache.clear()
+
+@receiver([post_save,post_delete],sender=LegalDocument)
+@receiver([post_save,post_delete],sender=LegalDocumentVersion)
+def clear_legal_cache(sender,**kwargs):
+    """
+    Clear legal documents cache when documents change
+    """
+    legal_cache.clear()
+
+@receiver([post_save,post_delete],sender=DBTemplate)
+def clear_dbtemplates_cache(sender,**kwargs):
+    """
+    Clear compiled database templates cache when templates change
+    """
+    dbtemplates_cache.clear()
+
+@receiver([post_save,post_delete],sender=SiteInfo)
+def clear_robots_cache(sender,**kwargs):
+    """
+    Clear robots contents cache when site information changes
+    """
+    robots_cache.clear()
+
+# Full text search fields registration
+search.register(SiteLog,('message','tag','ip','data'))
+search.register(ContactMessage,('name','email','ip','text'))
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Site tools full text search backends module
+===============================================
+
+.. module:: sitetools.search
+    :platform: Django
+    :synopsis: Site tools full text search backends module
+.. moduleauthor:: (C) 2014 Oliver Gutiérrez
+
+Search backends are registered for a model and a list of its text fields, and selected with
+SEARCH_BACKEND setting. Site log and contact message models are registered by models module.
+Registered models administration classes using FullTextSearchAdminMixin search through them. Indexes are created by setupsearch command.
+"""
+
+# Django imports
+from django.db import connections, router
+from django.db.models.signals import post_save, post_delete
+from django.utils.encoding import force_text
+from django.utils.module_loading import import_string
+from django.conf import settings
+
+# Registered models fields
+_registry = {}
+
+# Search backend instances by model
+_backends = {}
+
+
+class BaseSearchBackend(object):
+    """
+    Base search backend class
+
+    Searching returns None, so default administration search is used
+    """
+    def __init__(self, model, fields):
+        """
+        Class initialization method
+        """
+        self.model = model
+        self.fields = fields
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    def get_connection(self):
+        """
+        Get connection for model database
+        """
+        return connections[router.db_for_write(self.model)]
+
+    def connect_signals(self):
+        """
+        Connect model signals for keeping index up to date if needed
+        """
+        pass
+
+    def setup(self):
+        """
+        Create index structures in database
+        """
+        pass
+
+    def rebuild(self):
+        """
+        Rebuild index contents from model table
+        """
+        pass
+
+    def search(self, qs, term):
+        """
+        Filter a queryset using a search term
+
+        :returns: Filtered queryset or None if default search must be used
+        """
+        return None
+
+
+class PostgreSQLSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL search backend using a GIN index over a tsvector expression of model fields
+
+    Index is maintained by database itself, so no signals are needed. Text search
+    configuration is taken from SEARCH_POSTGRESQL_CONFIG setting.
+    """
+    def get_vector(self, qn, table=None):
+        """
+        Get tsvector SQL expression for model fields
+        """
+        columns = []
+        for name in self.fields:
+            column = qn(self.model._meta.get_field(name).column)
+            if table is not None:
+                column = '%s.%s' % (qn(table), column)
+            columns.append("COALESCE(%s::text, '')" % column)
+        return "to_tsvector('%s', %s)" % (settings.SEARCH_POSTGRESQL_CONFIG, " || ' ' || ".join(columns))
+
+    def setup(self):
+        """
+        Create GIN index for model fields tsvector
+
+        Index is built concurrently, so table writes are not blocked while building it
+        """
+        connection = self.get_connection()
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s USING GIN ((%s))' % (
+                qn('%s_fts' % self.table), qn(self.table), self.get_vector(qn)))
+
+    def search(self, qs, term):
+        """
+        Filter a queryset using a full text query
+        """
+        qn = self.get_connection().ops.quote_name
+        where = "%s @@ plainto_tsquery('%s', %%s)" % (self.get_vector(qn, self.table), settings.SEARCH_POSTGRESQL_CONFIG)
+        return qs.extra(where=[where], params=[term])
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """
+    SQLite search backend using a FTS5 shadow table
+
+    Shadow table rows are updated when model instances are saved or deleted. Entries created
+    with bulk_create, like buffered site log entries, are indexed only by rebuilding index.
+    """
+    @property
+    def fts_table(self):
+        return '%s_fts' % self.table
+
+    def connect_signals(self):
+        """
+        Connect model signals for keeping shadow table up to date
+        """
+        post_save.connect(self.index_instance, sender=self.model, weak=False,
+                          dispatch_uid='sitetools_search_%s_save' % self.table)
+        post_delete.connect(self.remove_instance, sender=self.model, weak=False,
+                            dispatch_uid='sitetools_search_%s_delete' % self.table)
+
+    def get_content(self, instance):
+        """
+        Get indexed text for a model instance
+        """
+        values = [getattr(instance, name) for name in self.fields]
+        return u' '.join([force_text(value) for value in values if value is not None])
+
+    def index_instance(self, sender, instance, **kwargs):
+        """
+        Update shadow table row for a model instance
+        """
+        with self.get_connection().cursor() as cursor:
+            cursor.execute('DELETE FROM "%s" WHERE rowid = %%s' % self.fts_table, [instance.pk])
+            cursor.execute('INSERT INTO "%s" (rowid, content) VALUES (%%s, %%s)' % self.fts_table,
+                           [instance.pk, self.get_content(instance)])
+
+    def remove_instance(self, sender, instance, **kwargs):
+        """
+        Remove shadow table row for a model instance
+        """
+        with self.get_connection().cursor() as cursor:
+            cursor.execute('DELETE FROM "%s" WHERE rowid = %%s' % self.fts_table, [instance.pk])
+
+    def setup(self):
+        """
+        Create shadow table
+        """
+        with self.get_connection().cursor() as cursor:
+            cursor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS "%s" USING fts5(content)' % self.fts_table)
+
+    def rebuild(self, batch_size=1000):
+        """
+        Rebuild shadow table contents from model table
+        """
+        with self.get_connection().cursor() as cursor:
+            cursor.execute('DELETE FROM "%s"' % self.fts_table)
+            last = None
+            while True:
+                qs = self.model._default_manager.order_by('pk')
+                if last is not None:
+                    qs = qs.filter(pk__gt=last)
+                batch = list(qs[:batch_size])
+                if not batch:
+                    break
+                cursor.executemany('INSERT INTO "%s" (rowid, content) VALUES (%%s, %%s)' % self.fts_table,
+                                   [(instance.pk, self.get_content(instance)) for instance in batch])
+                last = batch[-1].pk
+
+    def search(self, qs, term):
+        """
+        Filter a queryset using a full text query with all search term words
+        """
+        words = term.split()
+        if not words:
+            return qs
+        query = u' '.join([u'"%s"' % word.replace('"', '""') for word in words])
+        where = '"%s"."%s" IN (SELECT rowid FROM "%s" WHERE "%s" MATCH %%s)' % (
+            self.table, self.model._meta.pk.column, self.fts_table, self.fts_table)
+        return qs.extra(where=[where], params=[query])
+
+
+def register(model, fields):
+    """
+    Register a model and its fields for full text searching
+    """
+    _registry[model] = tuple(fields)
+    backend = get_search_backend(model)
+    if backend is not None:
+        backend.connect_signals()
+    return backend
+
+
+def get_search_backend(model):
+    """
+    Get search backend instance for a registered model or None if no backend is used
+    """
+    if not settings.SEARCH_BACKEND or model not in _registry:
+        return None
+    backend = _backends.get(model)
+    if backend is None:
+        backend = _backends.setdefault(model, import_string(settings.SEARCH_BACKEND)(model, _registry[model]))
+    return backend
+
+
+def get_search_backends():
+    """
+    Get search backend instances for all registered models
+    """
+    return [backend for backend in [get_search_backend(model) for model in _registry] if backend is not None]
@@ -9,9 +9,55 @@ Django site tools application default settings
 .. moduleauthor:: (C) 2014 Oliver Gutiérrez
 """
 
-# Static sendfile backend
+# Static sendfile backend (mod_xsendfile, nginx_xaccel or direct)
 STATIC_SENDFILE_BACKEND = 'mod_xsendfile'
 
+# Site tools caches timeout in seconds (0 disables caching)
+SITE_CACHE_TIMEOUT = 300
+
+# Django cache alias used for sharing site tools cache invalidations between processes
+SITE_CACHE_BACKEND = None
+
+# Module used for encoding and decoding JSON fields (json, simplejson, ujson, etc.)
+JSONFIELD_BACKEND = 'json'
+
+# Full text search backend class for site log and contact messages administration. Default
+# administration search is used if None. Available backends:
+#   'sitetools.search.PostgreSQLSearchBackend'
+#   'sitetools.search.SQLiteSearchBackend'
+# Run setupsearch command after enabling it
+SEARCH_BACKEND = None
+
+# PostgreSQL text search configuration used by PostgreSQL search backend
+SEARCH_POSTGRESQL_CONFIG = 'simple'
+
+# Number of rows from which administration changelists with approximate counts use database estimates
+ADMIN_APPROXIMATE_COUNT_THRESHOLD = 100000
+
+# Seconds to keep administration changelists counts in cache
+ADMIN_COUNT_CACHE_TIMEOUT = 60
+
+# Precompressed static files content encodings and extensions by preference order
+STATIC_PRECOMPRESSED_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Seconds static files metadata (size, modification time, ETag, etc.) is cached
+STATIC_METADATA_CACHE_TIMEOUT = 5
+
+# Static files manifest name generated by hashstatic command inside STATIC_ROOT
+STATIC_MANIFEST_NAME = 'staticmanifest.json'
+
+# Cache max age in seconds for hashed static files
+STATIC_IMMUTABLE_MAX_AGE = 31536000
+
+# Python path to sitemaps dictionary used by rendersitemaps command
+SITEMAPS = None
+
+# Directory where rendersitemaps command writes sitemaps for each site domain
+SITEMAP_ROOT = None
+
+# URL prefix for sitemap files rendered by rendersitemaps command
+SITEMAP_URL = '/'
+
 # Site under maintenance
 SITE_UNDER_MAINTENANCE = False
 
@@ -48,12 +94,106 @@ SHOW_PREVIOUS_LEGAL_DOCUMENT_VERSIONS = False
 # Site log level for mailing administrators
 SITE_LOG_MAIL_ADMINS_LEVEL = 0
 
+# Write site log entries in batches from a background thread
+SITE_LOG_BUFFERED = False
+
+# Maximum number of queued site log entries before writing synchronously
+SITE_LOG_BUFFER_SIZE = 10000
+
+# Maximum number of site log entries written in each batch
+SITE_LOG_BATCH_SIZE = 100
+
+# Maximum time in milliseconds site log entries wait in queue
+SITE_LOG_FLUSH_INTERVAL = 500
+
+# Days to keep site log entries when running purgesitelog command
+SITE_LOG_RETENTION_DAYS = None
+
+# Mail backend used by site tools mail helpers (EMAIL_BACKEND if None). Use console or file based
+# backends for testing without a mail server
+MAIL_BACKEND = None
+
+# Send mails from background threads by default
+MAIL_BACKGROUND = False
+
+# Number of background mail sending threads
+MAIL_WORKERS = 1
+
+# Maximum number of messages waiting for background sending
+MAIL_QUEUE_SIZE = 1000
+
+# Number of retries for messages failing in background sending
+MAIL_RETRIES = 3
+
+# Seconds to wait before retrying after an immediate retry with a new connection. Doubled on each retry
+MAIL_RETRY_DELAY = 1
+
+# Seconds without sending messages before closing background threads connections
+MAIL_IDLE_TIMEOUT = 30
+
+# Maximum number of compiled database templates kept in cache
+DBTEMPLATE_CACHE_SIZE = 100
+
+# Maximum number of compiled templates kept in cache by stringrender template tag
+STRINGRENDER_CACHE_SIZE = 500
+
+# Maximum template string length cached by stringrender template tag
+STRINGRENDER_CACHE_MAX_LENGTH = 65536
+
+# Raise stringrender template tag errors instead of rendering an empty string
+STRINGRENDER_STRICT = False
+
+# Seconds remote_content template tag contents are considered fresh
+REMOTE_CONTENT_TTL = 300
+
+# Seconds outdated remote contents are served while being refreshed
+REMOTE_CONTENT_STALE_TTL = 3600
+
+# Remote contents fetching timeout in seconds
+REMOTE_CONTENT_TIMEOUT = 5
+
+# Maximum remote content size in bytes
+REMOTE_CONTENT_MAX_SIZE = 1048576
+
+# Number of background threads fetching remote contents
+REMOTE_CONTENT_WORKERS = 2
+
+# Seconds to wait for remote contents not cached yet (0 renders nothing until fetched)
+REMOTE_CONTENT_MISS_WAIT = 0
+
 # Site template prefix
 SITE_TEMPLATE_PREFIX='site_templates'
 
+# Maximum number of site template resolutions kept in cache
+SITE_TEMPLATE_CACHE_SIZE=1000
+
+# Seconds to keep site template resolutions in cache when DEBUG is enabled
+SITE_TEMPLATE_DEBUG_CACHE_TIMEOUT=2
+
 # Alert by email on new contact messages (Used in contact form view)
 CONTACT_MESSAGE_MAIL_ALERT=True
 
 # ReCAPTCHA keys
 RECAPTCHA_PUB_KEY=None
-RECAPTCHA_PRIV_KEY=None
\ No newline at end of file
+RECAPTCHA_PRIV_KEY=None
+
+# ReCAPTCHA verifier class
+RECAPTCHA_VERIFIER='sitetools.forms.recaptcha.HTTPRECAPTCHAVerifier'
+
+# ReCAPTCHA verification timeout in seconds
+RECAPTCHA_TIMEOUT=5
+
+# Accept ReCAPTCHA answers when verification service is unavailable
+RECAPTCHA_FAIL_OPEN=True
+
+# Consecutive ReCAPTCHA verification failures before skipping verification service
+RECAPTCHA_CIRCUIT_FAILURES=5
+
+# Seconds ReCAPTCHA verification service is skipped after consecutive failures
+RECAPTCHA_CIRCUIT_TIMEOUT=30
+
+# Seconds successful ReCAPTCHA verifications are remembered
+RECAPTCHA_VERIFIED_CACHE_TIMEOUT=120
+
+# ReCAPTCHA answers rejected by local verifier
+RECAPTCHA_LOCAL_INVALID_RESPONSES=('invalid',)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+r"""
+Site tools sitemaps module
+===============================================
+
+.. module:: sitetools.sitemaps
+    :platform: Django
+    :synopsis: Site tools sitemaps module
+.. moduleauthor:: (C) 2014 Oliver Gutiérrez
+
+Sitemaps are generated as streams, iterating over querysets instead of loading all items in
+memory, and splitted in several files when they have more than 50000 URLs.
+
+URL configuration example::
+
+    sitemaps = {
+        'products': ProductSitemap,
+    }
+
+    urlpatterns = [
+        url(r'^sitemap\.xml$', sitemap_index_view, {'sitemaps': sitemaps}),
+        url(r'^sitemap-(?P<section>[\w-]+)\.xml$', sitemap_view, {'sitemaps': sitemaps}, name='sitemap_section'),
+    ]
+"""
+
+# Python imports
+from xml.sax.saxutils import escape
+
+# Django imports
+from django.core.urlresolvers import reverse
+from django.http import Http404, StreamingHttpResponse
+from django.utils.encoding import force_text, force_bytes
+from django.utils.translation import ugettext
+
+# Application imports
+from sitetools.utils import get_site_from_request, build_site_url
+
+# Maximum number of URLs in a sitemap file
+SITEMAP_MAX_URLS = 50000
+
+
+class StreamingSitemap(object):
+    """
+    Base sitemap class
+
+    Subclasses must define items method returning a queryset for given site. Items are listed
+    in primary key order
+    """
+    # Number of URLs per sitemap file
+    limit = SITEMAP_MAX_URLS
+    # Number of rows fetched from database at once
+    chunk_size = 2000
+    # Default change frequency and priority
+    changefreq = None
+    priority = None
+
+    def items(self, site):
+        """
+        Get items queryset for given site
+        """
+        raise NotImplementedError()
+
+    def location(self, item):
+        """
+        Get item relative URL
+        """
+        return item.get_absolute_url()
+
+    def lastmod(self, item):
+        """
+        Get item last modification date or None
+        """
+        return None
+
+    def get_changefreq(self, item):
+        """
+        Get item change frequency or None
+        """
+        return self.changefreq
+
+    def get_priority(self, item):
+        """
+        Get item priority or None
+        """
+        return self.priority
+
+    def get_num_pages(self, site):
+        """
+        Get number of sitemap files needed for given site
+        """
+        count = self.items(site).count()
+        return max((count + self.limit - 1) // self.limit, 1)
+
+    def iter_items(self, site, page=1):
+        """
+        Iterate over a page of items fetching them from database in chunks
+
+        Chunks are fetched by primary key position instead of offsets, so deep pages do not scan
+        all previous rows for each chunk
+        """
+        qs = self.items(site).order_by('pk')
+        remaining = self.limit
+        last = None
+        if page > 1:
+            # Primary key of the last item in previous page
+            start = (page - 1) * self.limit
+            previous = list(qs.values_list('pk', flat=True)[start - 1:start])
+            if not previous:
+                return
+            last = previous[0]
+        while remaining > 0:
+            chunk_qs = qs if last is None else qs.filter(pk__gt=last)
+            chunk = list(chunk_qs[:min(self.chunk_size, remaining)])
+            for item in chunk:
+                yield item
+            if len(chunk) < min(self.chunk_size, remaining):
+                break
+            remaining -= len(chunk)
+            last = chunk[-1].pk
+
+    def iter_xml(self, site, page=1, secure=False):
+        """
+        Iterate over sitemap XML document parts for a page of items
+        """
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        for item in self.iter_items(site, page):
+            parts = ['<url><loc>%s</loc>' % escape(build_site_url(site, self.location(item), secure))]
+            lastmod = self.lastmod(item)
+            if lastmod is not None:
+                parts.append('<lastmod>%s</lastmod>' % lastmod.isoformat())
+            changefreq = self.get_changefreq(item)
+            if changefreq is not None:
+                parts.append('<changefreq>%s</changefreq>' % changefreq)
+            priority = self.get_priority(item)
+            if priority is not None:
+                parts.append('<priority>%.1f</priority>' % priority)
+            parts.append('</url>\n')
+            yield force_bytes(u''.join(parts))
+        yield '</urlset>\n'
+
+
+def get_sitemap(sitemaps, section):
+    """
+    Get sitemap instance for a section of a sitemaps dictionary with classes or instances
+    """
+    try:
+        sitemap = sitemaps[section]
+    except KeyError:
+        raise Http404(ugettext('No sitemap available for section: %r') % section)
+    if callable(sitemap):
+        sitemap = sitemap()
+    return sitemap
+
+
+def iter_sitemap_index(sitemaps, site, secure=False, section_url=None):
+    """
+    Iterate over sitemap index XML document parts
+
+    :param section_url: Function returning a section page relative URL from section name and page number
+    """
+    if section_url is None:
+        def section_url(section, page):
+            return '%s?p=%d' % (reverse('sitemap_section', kwargs={'section': section}), page)
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for section in sorted(sitemaps.keys()):
+        sitemap = get_sitemap(sitemaps, section)
+        for page in range(1, sitemap.get_num_pages(site) + 1):
+            url = build_site_url(site, section_url(section, page), secure)
+            yield force_bytes(u'<sitemap><loc>%s</loc></sitemap>\n' % escape(force_text(url)))
+    yield '</sitemapindex>\n'
+
+
+def sitemap_index_view(request, sitemaps, section_url_name='sitemap_section'):
+    """
+    Sitemap index view for current site
+    """
+    site = get_site_from_request(request)
+
+    def section_url(section, page):
+        return '%s?p=%d' % (reverse(section_url_name, kwargs={'section': section}), page)
+
+    return StreamingHttpResponse(iter_sitemap_index(sitemaps, site, request.is_secure(), section_url),
+                                 content_type='application/xml')
+
+
+def sitemap_view(request, sitemaps, section):
+    """
+    Sitemap section view for current site. Page number is taken from "p" GET parameter
+    """
+    site = get_site_from_request(request)
+    sitemap = get_sitemap(sitemaps, section)
+    try:
+        page = int(request.GET.get('p', 1))
+    except ValueError:
+        raise Http404(ugettext('Invalid sitemap page'))
+    if page < 1 or page > sitemap.get_num_pages(site):
+        raise Http404(ugettext('Invalid sitemap page'))
+    return StreamingHttpResponse(sitemap.iter_xml(site, page, request.is_secure()),
+                                 content_type='application/xml')
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Site tools template loaders module
+===============================================
+
+.. module:: sitetools.template.loaders
+    :platform: Django
+    :synopsis: Site tools template loaders module
+.. moduleauthor:: (C) 2014 Oliver Gutiérrez
+"""
+
+# Django imports
+from django.core.validators import slug_re
+from django.template import TemplateDoesNotExist
+from django.template.base import Origin
+from django.template.loaders.base import Loader as BaseLoader
+
+class DBTemplateLoader(BaseLoader):
+    """
+    Template loader for database templates
+
+    Template names are database template slugs. Compiled templates are shared with DBTemplate
+    rendering cache. Add it after filesystem loaders to TEMPLATES loaders option:
+
+        'sitetools.template.loaders.DBTemplateLoader'
+    """
+    def get_template_sources(self, template_name, template_dirs=None):
+        """
+        Return template origins for given template name
+        """
+        if slug_re.match(template_name):
+            yield Origin(name='dbtemplate:%s' % template_name, template_name=template_name, loader=self)
+
+    def get_contents(self, origin):
+        """
+        Return template contents for given origin
+        """
+        from sitetools.models import DBTemplate
+        try:
+            return DBTemplate.objects.get(slug=origin.template_name).content or u''
+        except DBTemplate.DoesNotExist:
+            raise TemplateDoesNotExist(origin)
+
+    def get_template(self, template_name, template_dirs=None, skip=None):
+        """
+        Return compiled template using database templates cache
+        """
+        from sitetools.models import DBTemplate
+        tried = []
+        for origin in self.get_template_sources(template_name):
+            if skip is not None and origin in skip:
+                tried.append((origin, 'Skipped'))
+                continue
+            try:
+                return DBTemplate.get_cached_template(template_name, self.engine, origin)
+            except DBTemplate.DoesNotExist:
+                tried.append((origin, 'Source does not exist'))
+        raise TemplateDoesNotExist(template_name, tried=tried)
@@ -12,13 +12,23 @@
 
 # Django imports
 from django.utils import six
+from django.utils import autoreload
 from django.utils._os import safe_join
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template, select_template
 from django.template.response import TemplateResponse
 from django.conf import settings
 
 # Application imports
+from sitetools.cache import LocalCache
+from sitetools.models import DBTemplate
 from sitetools.utils import get_site_from_request
 
+# Resolved template names by site domain and template candidates
+template_resolution_cache=LocalCache('templateresolution',maxsize=settings.SITE_TEMPLATE_CACHE_SIZE,shared=False)
+
 class SiteTemplateResponse(TemplateResponse):
     """
     Template response that uses a site specific template if available
@@ -45,5 +55,34 @@ class SiteTemplateResponse(TemplateResponse):
                 templatelist.append(safe_join(prefix,t))
                 templatelist.append(t)
             template=templatelist
-        # Call parent method
-        return super(SiteTemplateResponse,self).resolve_template(template)
\ No newline at end of file
+        else:
+            # Call parent method
+            return super(SiteTemplateResponse,self).resolve_template(template)
+        # Use the template name found in a previous resolution, skipping missing candidates
+        key=(site.domain,tuple(template),self.using)
+        name=template_resolution_cache.get(key)
+        if name is not None:
+            try:
+                return get_template(name,using=self.using)
+            except TemplateDoesNotExist:
+                template_resolution_cache.delete(key)
+        resolved=select_template(template,using=self.using)
+        origin=getattr(getattr(resolved,'template',None),'origin',None)
+        name=getattr(origin,'template_name',None)
+        if name is not None:
+            if settings.DEBUG:
+                template_resolution_cache.set(key,name,settings.SITE_TEMPLATE_DEBUG_CACHE_TIMEOUT)
+            else:
+                template_resolution_cache.set(key,name,None)
+        return resolved
+
+@receiver([post_save,post_delete],sender=DBTemplate)
+def clear_template_resolution_cache(sender=None,**kwargs):
+    """
+    Clear site template resolution cache when templates change
+    """
+    template_resolution_cache.clear()
+
+# Clear site template resolution cache when development server detects file changes
+if hasattr(autoreload,'file_changed'):
+    autoreload.file_changed.connect(clear_template_resolution_cache)
\ No newline at end of file
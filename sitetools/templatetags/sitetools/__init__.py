@@ -13,7 +13,7 @@ Site tools template tags module
 from django import template
 
 # Application imports
-from filters import shuffle_list,set_arg,call_method,get_range,without_lang,b64encode,html_decode,month_name,dict_lookup # currency_formatter,file_size_formatter
+from filters import shuffle_list,set_arg,call_method,get_range,without_lang,b64encode,html_decode,month_name,dict_lookup,hashed_static # currency_formatter,file_size_formatter
 from tags.stringrender import stringrender_tag
 from tags.remote_content import remote_content_tag
 # Initialize template tag library
@@ -31,6 +31,7 @@ register.filter('callmethod', call_method)
 register.filter('without_lang',without_lang)
 register.filter('b64encode',b64encode)
 register.filter('month_name',month_name)
+register.filter('hashed_static',hashed_static)
 # Register tags
 register.tag('stringrender',stringrender_tag)
 register.tag('remote_content',remote_content_tag)
\ No newline at end of file
@@ -18,6 +18,9 @@ from django.conf import settings
 from django import template
 from django.utils.translation import ugettext
 
+# Application imports
+from sitetools.utils import get_hashed_static_name
+
 def dict_lookup(d, key):
     """
     Return dictionary value for given key
@@ -89,6 +92,12 @@ def html_decode(s):
         s = s.replace(code[1], code[0])
     return s
 
+def hashed_static(path):
+    """
+    Return static URL for a static file using its hashed name from static files manifest
+    """
+    return settings.STATIC_URL + get_hashed_static_name(path)
+
 def month_name(number):
     """
     Return month name from a number between 1-12
@@ -10,7 +10,7 @@ Remote content getter template tag
 """
 
 # Python imports
-import urllib, warnings
+import urllib2, warnings, time, threading, traceback, Queue
 
 # Try to import cssselect module
 try:
@@ -23,11 +23,136 @@ except ImportError:
 from django import template
 from django.conf import settings
 
+# Application imports
+from sitetools.cache import LocalCache
+
+class RemoteContentFetcher(object):
+    """
+    Remote content fetcher with stale-while-revalidate caching
+
+    Contents are fetched by background worker threads, so rendering never waits for remote
+    servers more than REMOTE_CONTENT_MISS_WAIT seconds. Cached contents older than their TTL
+    are served while being refreshed, until REMOTE_CONTENT_STALE_TTL seconds later.
+    """
+    def __init__(self):
+        """
+        Class initialization method
+        """
+        self.cache=LocalCache('remote_content',shared=False)
+        self._queue=Queue.Queue()
+        self._pending={}
+        self._lock=threading.Lock()
+        self._workers=[]
+
+    def _start_workers(self):
+        """
+        Start background worker threads if not running
+        """
+        with self._lock:
+            self._workers=[w for w in self._workers if w.is_alive()]
+            for i in range(settings.REMOTE_CONTENT_WORKERS - len(self._workers)):
+                worker=threading.Thread(target=self._run,name='sitetools-remote-content')
+                worker.daemon=True
+                worker.start()
+                self._workers.append(worker)
+
+    def _run(self):
+        """
+        Background worker loop
+        """
+        while True:
+            url,ttl=self._queue.get()
+            try:
+                self.fetch(url,ttl)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    event=self._pending.pop(url,None)
+                if event is not None:
+                    event.set()
+
+    def fetch(self,url,ttl):
+        """
+        Fetch remote content and store it in cache
+
+        On errors, previous contents are kept for another TTL period
+        """
+        try:
+            resp=urllib2.urlopen(url,timeout=settings.REMOTE_CONTENT_TIMEOUT)
+            try:
+                content=resp.read(settings.REMOTE_CONTENT_MAX_SIZE + 1)
+            finally:
+                resp.close()
+            if len(content) > settings.REMOTE_CONTENT_MAX_SIZE:
+                raise ValueError('Remote content from %s exceeds maximum size' % url)
+        except Exception:
+            entry=self.cache.get(url)
+            content=entry['content'] if entry is not None else ''
+            if settings.DEBUG:
+                traceback.print_exc()
+        entry={
+            'time': time.time(),
+            'content': content,
+            'selections': {},
+        }
+        self.cache.set(url,entry,ttl + settings.REMOTE_CONTENT_STALE_TTL)
+        return entry
+
+    def refresh(self,url,ttl):
+        """
+        Schedule a background fetch for an URL and return an event set when finished
+        """
+        with self._lock:
+            event=self._pending.get(url)
+            if event is not None:
+                return event
+            event=self._pending[url]=threading.Event()
+        self._start_workers()
+        self._queue.put((url,ttl))
+        return event
+
+    def get(self,url,selector=None,ttl=None):
+        """
+        Get cached remote content, optionally filtered by a CSS selector
+
+        Returns None if content is not available yet
+        """
+        if ttl is None:
+            ttl=settings.REMOTE_CONTENT_TTL
+        entry=self.cache.get(url)
+        if entry is None:
+            event=self.refresh(url,ttl)
+            if settings.REMOTE_CONTENT_MISS_WAIT:
+                event.wait(settings.REMOTE_CONTENT_MISS_WAIT)
+            entry=self.cache.get(url)
+            if entry is None:
+                return None
+        elif time.time() - entry['time'] > ttl:
+            self.refresh(url,ttl)
+        if selector is None:
+            return entry['content']
+        if PyQuery is None:
+            warnings.warn('PyQuery module not available. Selector has been ignored in remote_content template tag',RuntimeWarning)
+            return entry['content']
+        # Selections are cached along with content
+        selection=entry['selections'].get(selector)
+        if selection is None:
+            if entry['content']:
+                selection=PyQuery(entry['content'])(selector).html() or ''
+            else:
+                selection=''
+            entry['selections'][selector]=selection
+        return selection
+
+# Default remote content fetcher
+remote_content_fetcher=RemoteContentFetcher()
+
 class RemoteContentNode(template.Node):
     """
     Template node for remote_content tag
     """
-    def __init__(self, url, selector=None):
+    def __init__(self, url, selector=None, ttl=None):
         """
         Template node initialization
         """
@@ -35,6 +160,7 @@ class RemoteContentNode(template.Node):
         if selector is not None:
             self.selector=template.Variable(selector)
         self.url = template.Variable(url)
+        self.ttl = ttl
 
     def render(self, context):
         """
@@ -42,14 +168,13 @@ class RemoteContentNode(template.Node):
         """
         try:
             url=self.url.resolve(context)
-            resp=urllib.urlopen(url).read()
+            selector=None
             if self.selector is not None:
-                if PyQuery is not None:
-                    pq=PyQuery(resp)
-                    resp=pq(self.selector).html()
-                else:
-                    warnings.warn('PyQuery module not available. Selector has been ignored in remote_content template tag',RuntimeWarning)
-            return resp 
+                selector=self.selector.resolve(context)
+            resp=remote_content_fetcher.get(url,selector,self.ttl)
+            if resp is None:
+                return ''
+            return resp
         except Exception,e:
             if settings.DEBUG_TEMPLATE:
                 return unicode(e)
@@ -60,6 +185,13 @@ def remote_content_tag(parser, token):
     """
     # Manage parameters
     parms=token.split_contents()
+    tagname=parms[0]
+    ttl=None
+    if parms[-1].startswith('ttl='):
+        try:
+            ttl=int(parms.pop()[4:])
+        except ValueError:
+            raise template.TemplateSyntaxError, "%r tag ttl parameter must be an integer" % tagname
     l=len(parms)
     if l == 2:
         tagname, url = parms
@@ -67,8 +199,7 @@ def remote_content_tag(parser, token):
     elif l == 3:
         tagname, url, selector = parms
     else:
-        tagname=token.contents.split()[0]
-        raise template.TemplateSyntaxError, "%r tag parameters error. Syntax: %r url [css_selector]" % (tagname,tagname)
+        raise template.TemplateSyntaxError, "%r tag parameters error. Syntax: %r url [css_selector] [ttl=seconds]" % (tagname,tagname)
     # Return template node
-    return RemoteContentNode(url,selector)
+    return RemoteContentNode(url,selector,ttl)
 
@@ -9,9 +9,35 @@ Template string render tag module
 .. moduleauthor:: (C) 2012 Oliver Gutiérrez
 """
 
+# Python imports
+import hashlib
+
 # Django imports
 from django import template
 from django.conf import settings
+from django.utils.encoding import force_bytes
+
+# Application imports
+from sitetools.cache import LocalCache
+
+# Compiled template strings cache by source hash
+stringrender_cache = LocalCache('stringrender', None, settings.STRINGRENDER_CACHE_SIZE, shared=False)
+
+
+def get_string_template(template_string):
+    """
+    Get compiled template for a template string
+
+    Templates longer than STRINGRENDER_CACHE_MAX_LENGTH characters are not cached
+    """
+    if len(template_string) > settings.STRINGRENDER_CACHE_MAX_LENGTH:
+        return template.Template(template_string)
+    key = hashlib.md5(force_bytes(template_string)).hexdigest()
+    t = stringrender_cache.get(key)
+    if t is None:
+        t = template.Template(template_string)
+        stringrender_cache.set(key, t, None)
+    return t
 
 
 class StringRenderNode(template.Node):
@@ -29,11 +55,15 @@ class StringRenderNode(template.Node):
     def render(self, context):
         """
         Template node rendering method
+
+        Errors are raised if STRINGRENDER_STRICT is enabled
         """
         try:
-            t = template.Template(self.template_string.resolve(context))
+            t = get_string_template(self.template_string.resolve(context))
             return t.render(context)
         except Exception, e:
+            if settings.STRINGRENDER_STRICT:
+                raise
             print (e)
             return ''
 
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Site tools tests module
+===============================================
+
+.. module:: sitetools.tests
+    :platform: Django
+    :synopsis: Site tools tests module
+.. moduleauthor:: (C) 2014 Oliver Gutiérrez
+"""
+
+# Python imports
+import os
+import gzip
+import json
+import shutil
+import datetime
+import tempfile
+
+# Django imports
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+
+# Application imports
+from sitetools.models import SiteLog
+
+
+class PurgeSiteLogTestCase(TestCase):
+    """
+    Tests for purgesitelog command
+    """
+    def test_archive_entries_with_data(self):
+        """
+        Deleted entries with data are archived with their raw data
+        """
+        old = SiteLog.objects.create(tag='test', message='Old entry', data={'key': 'value'})
+        SiteLog.objects.filter(pk=old.pk).update(timestamp=timezone.now() - datetime.timedelta(days=10))
+        recent = SiteLog.objects.create(tag='test', message='Recent entry', data={'key': 'other'})
+        archive = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive)
+
+        call_command('purgesitelog', days=5, archive=archive, stdout=StringIO())
+
+        self.assertFalse(SiteLog.objects.filter(pk=old.pk).exists())
+        self.assertTrue(SiteLog.objects.filter(pk=recent.pk).exists())
+        filenames = os.listdir(archive)
+        self.assertEqual(len(filenames), 1)
+        f = gzip.open(os.path.join(archive, filenames[0]), 'rb')
+        try:
+            rows = [json.loads(line) for line in f]
+        finally:
+            f.close()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], old.pk)
+        self.assertEqual(json.loads(rows[0]['data']), {'key': 'value'})
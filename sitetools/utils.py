@@ -12,21 +12,52 @@ Sitetools utility functions module
 # Python imports
 import sys
 import os
+import re
 import datetime
 import random
 import string
+import json
+import time
+import uuid
+import decimal
+import mimetypes
+from collections import namedtuple
 
 # Django imports
 from django.template import RequestContext
 from django.core.mail import send_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.http import Http404
+from django.core import signing
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import connections, transaction, IntegrityError
+from django.db.models import Q
+from django.db.models.functions import Length
 from django.utils import six
 from django.utils.text import slugify
 from django.utils.translation import ugettext
+from django.utils.http import http_date, parse_http_date_safe
 from django.conf import settings
 
+# Application imports
+from sitetools.cache import LocalCache
+from sitetools.mail import mail_dispatcher
+
+# Site resolution cache by host name
+site_cache=LocalCache('sites')
+
+# Static files metadata cache by file path
+file_metadata_cache=LocalCache('filemetadata',maxsize=10000,shared=False)
+
+# Static file metadata
+FileMetadata=namedtuple('FileMetadata',('size','mtime','content_type','etag'))
+
+# Static files manifests cache by static root
+static_manifest_cache=LocalCache('staticmanifest',None,100,shared=False)
+
+# Static files manifest with hashed names by logical name and set of hashed names
+StaticManifest=namedtuple('StaticManifest',('paths','hashed'))
+
 def inject_app_defaults(appname):
     """
     Inject an application's default settings
@@ -63,15 +94,22 @@ def get_client_ip(req):
     return ip
 
 def get_site_from_request(request):
-        from django.contrib.sites.models import Site
-        # By default, our site will be the one we defined in settings
+    """
+    Get site matching request host or current site if none matches
+
+    Resolved host names are cached, including those not matching any site
+    """
+    from django.contrib.sites.models import Site
+    # Get request host
+    hostname=request.get_host()
+    site=site_cache.get(hostname,LocalCache.MISSING)
+    if site is LocalCache.MISSING:
+        site=Site.objects.filter(domain=hostname).first()
+        site_cache.set(hostname,site)
+    # By default, our site will be the one we defined in settings
+    if site is None:
         site=Site.objects.get_current()
-        # Get request host
-        hostname=request.get_host()
-        sites=Site.objects.filter(domain=hostname)
-        if sites.count() > 0:
-            site=sites[0]
-        return site
+    return site
 
 def build_site_url(site,url,secure=False):
     """
@@ -82,44 +120,251 @@ def build_site_url(site,url,secure=False):
         protocol='https'
     return u'%s://%s%s' % (protocol,site.domain,url)
 
+class CompiledURLMatcher(object):
+    """
+    URL matcher for a list of regular expressions checked in a single pass
+
+    Literal expressions are checked using a set for exact matches and a trie for prefixes,
+    remaining ones are joined in a single regular expression. Results are cached by path.
+    """
+    # Regular expression special characters
+    SPECIAL_CHARS=frozenset('.^$*+?{}[]|()')
+    # Inline flags, numbered backreferences and conditional groups change their meaning when joined
+    UNJOINABLE_RE=re.compile(r'\(\?[iLmsux]|\(\?\(|\\[1-9]')
+
+    def __init__(self,patternlist,cache_size=1000):
+        """
+        Class initialization method
+
+        :param patternlist: Regular expressions or compiled regular expressions
+        :type patternlist: List
+        :param cache_size: Maximum number of cached path results
+        :type cache_size: Integer
+        """
+        exact=set()
+        self.prefixes={}
+        self.has_prefixes=False
+        regexps=[]
+        self.compiled=[]
+        default_flags=re.compile('').flags
+        for pattern in patternlist:
+            if isinstance(pattern,six.string_types):
+                if self._add_literal(pattern,exact):
+                    continue
+                if self.UNJOINABLE_RE.search(pattern):
+                    self.compiled.append(re.compile(pattern))
+                else:
+                    regexps.append(pattern)
+            elif pattern.flags == default_flags and not self.UNJOINABLE_RE.search(pattern.pattern):
+                regexps.append(pattern.pattern)
+            else:
+                # Compiled expressions with custom flags or backreferences can not be joined
+                self.compiled.append(pattern)
+        self.exact=frozenset(exact)
+        if regexps:
+            try:
+                self.compiled.append(re.compile('|'.join(['(?:%s)' % r for r in regexps])))
+            except re.error:
+                # Expressions that can not be joined (duplicated group names, backreferences, etc.)
+                self.compiled.extend([re.compile(r) for r in regexps])
+        self._cache=LocalCache('urlmatcher',None,cache_size,shared=False)
+
+    def _literal(self,pattern):
+        """
+        Get literal text for a regular expression or None if it contains special characters
+        """
+        chars=[]
+        escaped=False
+        for c in pattern:
+            if escaped:
+                if c.isalnum():
+                    # Escape sequences like \d or \w
+                    return None
+                chars.append(c)
+                escaped=False
+            elif c == '\\':
+                escaped=True
+            elif c in self.SPECIAL_CHARS:
+                return None
+            else:
+                chars.append(c)
+        if escaped:
+            return None
+        return ''.join(chars)
+
+    def _add_literal(self,pattern,exact):
+        """
+        Add a regular expression to exact matches or prefixes if it is literal
+        """
+        # Expressions are matched at the start of text
+        if pattern.startswith('^'):
+            pattern=pattern[1:]
+        if pattern.endswith('.*$'):
+            pattern=pattern[:-3]
+            is_prefix=True
+        elif pattern.endswith('.*'):
+            pattern=pattern[:-2]
+            is_prefix=True
+        elif pattern.endswith('$'):
+            pattern=pattern[:-1]
+            is_prefix=False
+        else:
+            is_prefix=True
+        text=self._literal(pattern)
+        if text is None:
+            return False
+        if is_prefix:
+            node=self.prefixes
+            for c in text:
+                node=node.setdefault(c,{})
+            node[None]=True
+            self.has_prefixes=True
+        else:
+            exact.add(text)
+        return True
+
+    def _match_prefix(self,text):
+        """
+        Check if text starts with any of the literal prefixes
+        """
+        node=self.prefixes
+        if None in node:
+            return True
+        for c in text:
+            node=node.get(c)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
+    def match(self,text):
+        """
+        Checks if text matches any of the regular expressions
+        """
+        result=self._cache.get(text)
+        if result is None:
+            result=text in self.exact or (self.has_prefixes and self._match_prefix(text))
+            if not result:
+                for pattern in self.compiled:
+                    if pattern.match(text):
+                        result=True
+                        break
+            self._cache.set(text,result,None)
+        return result
+
 def match_any(text,patternlist):
     """
     Checks if text matches any of given strings or regexp list
     """
+    if isinstance(patternlist,CompiledURLMatcher):
+        return patternlist.match(text)
     for pattern in patternlist:
         if (isinstance(pattern,six.string_types) and text == pattern) or pattern.match(text):
             return True 
     return False
 
-def send_mail_from_template(recipient_list,subject_template_name,email_template_name,
-                            from_email=settings.DEFAULT_FROM_EMAIL,request=None,context={},
-                            fail_silently=False,auth_user=None, auth_password=None, connection=None):
+def render_mail_from_template(recipient_list,subject_template_name,email_template_name,html_template_name=None,
+                            from_email=settings.DEFAULT_FROM_EMAIL,request=None,context={},extra_contents=[]):
     """
-    Send email rendering a template
+    Render an email message from templates
+    If specified an HTML template, the mail will have an alternative content attached.
     """
     if request:
         context.update(RequestContext(request))
     subject=render_to_string(subject_template_name, context)
     subject=''.join(subject.splitlines())
-    message=render_to_string(email_template_name, context)
-    send_mail(subject, message, from_email, recipient_list, fail_silently, auth_user, auth_password, connection)
+    plaintext=render_to_string(email_template_name, context)
+    msg = EmailMultiAlternatives(subject, plaintext, from_email, recipient_list)
+    if html_template_name:
+        msg.attach_alternative(render_to_string(html_template_name, context), 'text/html')
+    # Attach extra contents
+    for content,content_type in extra_contents:
+        msg.attach_alternative(content, content_type)
+    return msg
 
-def send_mail_to_admins(subject_template_name,email_template_name,request=None,context={},fail_silently=True, managers=False):
+def send_mail_from_template(recipient_list,subject_template_name,email_template_name,
+                            from_email=settings.DEFAULT_FROM_EMAIL,request=None,context={},
+                            fail_silently=False,auth_user=None, auth_password=None, connection=None,background=None):
+    """
+    Send email rendering a template
+    """
+    if auth_user or auth_password or connection:
+        if request:
+            context.update(RequestContext(request))
+        subject=render_to_string(subject_template_name, context)
+        subject=''.join(subject.splitlines())
+        message=render_to_string(email_template_name, context)
+        return send_mail(subject, message, from_email, recipient_list, fail_silently, auth_user, auth_password, connection)
+    msg=render_mail_from_template(recipient_list,subject_template_name,email_template_name,None,from_email,request,context)
+    return mail_dispatcher.send([msg],background,fail_silently)
+
+def send_mail_to_admins(subject_template_name,email_template_name,request=None,context={},fail_silently=True, managers=False,background=None):
     """
     Send email to administrators
     """
     admins=[x[1] for x in settings.ADMINS]
     if managers:
         admins.extend([x[1] for x in settings.MANAGERS])
-    send_mail_from_template(admins, subject_template_name, email_template_name, context=context, fail_silently=fail_silently)
+    send_mail_from_template(admins, subject_template_name, email_template_name, context=context, fail_silently=fail_silently, background=background)
+
+def send_mass_mail_from_template(recipients,subject_template_name,email_template_name,html_template_name=None,
+                            from_email=settings.DEFAULT_FROM_EMAIL,background=None,fail_silently=False):
+    """
+    Send personalised emails rendering templates with a context for each recipient, using a
+    single connection
+
+    :param recipients: List of (recipient_list, context) tuples
+    :returns: Number of sent messages, or queued ones when sending in background
+    """
+    messages=[render_mail_from_template(recipient_list,subject_template_name,email_template_name,html_template_name,
+                                        from_email,context=context)
+              for recipient_list,context in recipients]
+    return mail_dispatcher.send(messages,background,fail_silently)
+
+def is_not_modified(request,etag,mtime):
+    """
+    Check request conditional headers against an ETag and a modification timestamp
+
+    :param etag: Quoted entity tag
+    :type etag: String
+    :param mtime: Modification time in seconds since epoch
+    :type mtime: Integer
+    """
+    if_none_match=request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags=[e.strip() for e in if_none_match.split(',')]
+        return '*' in etags or etag in etags or 'W/' + etag in etags
+    if_modified_since=parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    return if_modified_since is not None and mtime <= if_modified_since
+
+def get_file_metadata(filepath):
+    """
+    Get size, modification time, mime type and ETag for a file or None if it is not a regular file
+
+    Metadata is cached for STATIC_METADATA_CACHE_TIMEOUT seconds, including missing files
+    """
+    metadata=file_metadata_cache.get(filepath,LocalCache.MISSING)
+    if metadata is LocalCache.MISSING:
+        try:
+            stat=os.stat(filepath)
+        except OSError:
+            stat=None
+        if stat is None or os.path.stat.S_ISDIR(stat.st_mode):
+            metadata=None
+        else:
+            mtime=int(stat.st_mtime)
+            metadata=FileMetadata(stat.st_size,mtime,mimetypes.guess_type(filepath)[0],'"%x-%x"' % (mtime,stat.st_size))
+        file_metadata_cache.set(filepath,metadata,settings.STATIC_METADATA_CACHE_TIMEOUT)
+    return metadata
 
 def static_serve(filepath,*args,**kwargs):
     """
     Static serve tool function
     """
-    if os.path.exists(filepath) and not os.path.isdir(filepath):
-        from sitetools.http import StaticSendFileResponse
-        return StaticSendFileResponse(filepath,*args,**kwargs)
+    if get_file_metadata(filepath) is not None:
+        from sitetools.http import get_static_response
+        return get_static_response(filepath,*args,**kwargs)
     else:
         raise Http404(ugettext('Requested file "%s" does not exist') % filepath)
 
@@ -127,18 +372,47 @@ def generate_expiration_date(seconds=604800):
     """
     Generates an expiration date (default 7 days)
     """
-    date = datetime.datetime.now() + datetime.timedelta(seconds=seconds)
-    return date.strftime('%a, %d %b %Y %H:%M:%S GMT')
+    return http_date(time.time() + seconds)
+
+def get_static_manifest(root=None):
+    """
+    Get static files manifest generated by hashstatic command for given root (STATIC_ROOT by default)
+
+    Manifest is kept in memory and reloaded when manifest file changes
+    """
+    if root is None:
+        root=settings.STATIC_ROOT
+    manifestpath=os.path.join(root,settings.STATIC_MANIFEST_NAME)
+    metadata=get_file_metadata(manifestpath)
+    if metadata is None:
+        return StaticManifest({},frozenset())
+    cached=static_manifest_cache.get(root)
+    if cached is not None and cached[0] == metadata.etag:
+        return cached[1]
+    with open(manifestpath) as f:
+        data=json.load(f)
+    paths=data.get('paths',{})
+    manifest=StaticManifest(paths,frozenset(paths.values()) | frozenset(data.get('hashed',())))
+    static_manifest_cache.set(root,(metadata.etag,manifest),None)
+    return manifest
+
+def get_hashed_static_name(path,root=None):
+    """
+    Get hashed name for a static file logical name or the same name if it is not in manifest
+    """
+    return get_static_manifest(root).paths.get(path,path)
 
 def last_file_modification_date(*args,**kwargs):
-    try:
-        mtime=os.path.getmtime(settings.STATIC_ROOT + kwargs['path'])
-        return datetime.datetime.fromtimestamp(mtime)
-    except:
-        return datetime.datetime.now()
+    """
+    Get static file modification date or None if file does not exist
+    """
+    metadata=get_file_metadata(settings.STATIC_ROOT + kwargs['path'])
+    if metadata is not None:
+        return datetime.datetime.utcfromtimestamp(metadata.mtime)
+    return None
 
 def send_mail_alternatives_raw(recipient_list,subject,plaintext,html=None,
-                            from_email=settings.DEFAULT_FROM_EMAIL,request=None,extra_contents=[]):
+                            from_email=settings.DEFAULT_FROM_EMAIL,request=None,extra_contents=[],background=None):
     """
     Send email
     If specified html, the mail will have an alternative content attached.
@@ -149,30 +423,179 @@ def send_mail_alternatives_raw(recipient_list,subject,plaintext,html=None,
     # Attach extra contents
     for content,content_type in extra_contents:
         msg.attach_alternative(content, content_type)
-    msg.send()
+    mail_dispatcher.send([msg],background)
 
 def send_mail_alternatives(recipient_list,subject_template_name,email_template_name,html_template_name=None,
-                            from_email=settings.DEFAULT_FROM_EMAIL,request=None,context={},extra_contents=[]):
+                            from_email=settings.DEFAULT_FROM_EMAIL,request=None,context={},extra_contents=[],background=None):
     """
     Send email rendering a template
     If specified an HTML template, the mail will have an alternative content attached.
     """
-    if request:
-        context.update(RequestContext(request))
-    subject=render_to_string(subject_template_name, context)
-    subject=''.join(subject.splitlines())
-    plaintext=render_to_string(email_template_name, context)
-    if html_template_name:
-        htmlcontent=render_to_string(html_template_name, context)
+    msg=render_mail_from_template(recipient_list,subject_template_name,email_template_name,html_template_name,
+                                  from_email,request,context,extra_contents)
+    mail_dispatcher.send([msg],background)
+
+def get_approximate_count(qs):
+    """
+    Get an approximate number of rows for a queryset
+
+    On PostgreSQL the query planner estimate is used. Other databases use an exact count
+    """
+    connection=connections[qs.db]
+    if connection.vendor != 'postgresql':
+        return qs.count()
+    sql,params=qs.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) %s' % sql,params)
+        plan=cursor.fetchone()[0]
+    if isinstance(plan,six.string_types):
+        plan=json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+class KeysetPage(object):
+    """
+    Page of a queryset paginated by keyset
+
+    Provides the same navigation methods as Django pages, returning cursors instead of page numbers
+    """
+    def __init__(self,object_list,next_cursor=None,previous_cursor=None,count=None):
+        """
+        Class initialization method
+        """
+        self.object_list=object_list
+        self.next_cursor=next_cursor
+        self.previous_cursor=previous_cursor
+        self.count=count
+
+    def __repr__(self):
+        return '<KeysetPage of %d items>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self,index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.next_cursor
+
+    def previous_page_number(self):
+        return self.previous_cursor
+
+def get_keyset_ordering(qs,ordering=None):
+    """
+    Get keyset pagination ordering for a queryset, ending with primary key to make it unique
+    """
+    if ordering is None:
+        ordering=qs.query.order_by or qs.model._meta.ordering
+    if not ordering:
+        ordering=['pk']
+    ordering=[o.replace('pk',qs.model._meta.pk.attname) if o.lstrip('-') == 'pk' else o for o in ordering]
+    if ordering[-1].lstrip('-') != qs.model._meta.pk.attname:
+        ordering.append(qs.model._meta.pk.attname)
+    return ordering
+
+def encode_keyset_value(value):
+    """
+    Get a JSON serializable representation of a keyset field value without losing precision
+    """
+    if isinstance(value,(datetime.date,datetime.time)):
+        # Includes microseconds, unlike JSON encoder
+        return value.isoformat()
+    if isinstance(value,(decimal.Decimal,uuid.UUID)):
+        return six.text_type(value)
+    return value
+
+def encode_keyset_cursor(obj,ordering,previous=False):
+    """
+    Get an opaque signed cursor token for an object position
+    """
+    values=[encode_keyset_value(getattr(obj,o.lstrip('-'))) for o in ordering]
+    return signing.dumps({ 'v': values, 'p': previous },salt='sitetools.keyset',compress=True)
+
+def decode_keyset_cursor(cursor,ordering):
+    """
+    Get position values and direction from a cursor token
+
+    :raises: ValueError if cursor is not valid
+    """
+    try:
+        data=signing.loads(cursor,salt='sitetools.keyset')
+    except signing.BadSignature:
+        raise ValueError('Invalid cursor')
+    if len(data['v']) != len(ordering):
+        raise ValueError('Invalid cursor')
+    return data['v'],data['p']
+
+def paginate_keyset(qs,cursor=None,items_per_page=25,ordering=None,count=None):
+    """
+    Returns a page of a queryset paginated by keyset
+
+    Items following the cursor position are retrieved using a filter on ordering fields instead
+    of an OFFSET, so deep pages are as fast as first one.
+
+    :param ordering: Model field names for ordering. Primary key is appended if not present.
+    :param count: Number of items to show in page "count" attribute. Can be None, "exact" or "approximate"
+    """
+    ordering=get_keyset_ordering(qs,ordering)
+    previous=False
+    if cursor:
+        try:
+            values,previous=decode_keyset_cursor(cursor,ordering)
+        except ValueError:
+            cursor=None
+    if count == 'exact':
+        total=qs.count()
+    elif count == 'approximate':
+        total=get_approximate_count(qs)
+    else:
+        total=None
+    if previous:
+        order=[o[1:] if o.startswith('-') else '-' + o for o in ordering]
     else:
-        htmlcontent=None
-    send_mail_alternatives_raw(recipient_list,subject,plaintext,htmlcontent,from_email,request,extra_contents) 
+        order=ordering
+    if cursor:
+        condition=None
+        equal={}
+        for o,value in zip(order,values):
+            field=o.lstrip('-')
+            cond=Q(**dict(equal,**{ '%s__%s' % (field,'lt' if o.startswith('-') else 'gt'): value }))
+            condition=cond if condition is None else condition | cond
+            equal[field]=value
+        qs=qs.filter(condition)
+    object_list=list(qs.order_by(*order)[:items_per_page + 1])
+    more=len(object_list) > items_per_page
+    object_list=object_list[:items_per_page]
+    if previous:
+        object_list.reverse()
+    next_cursor=previous_cursor=None
+    if object_list:
+        if more or previous:
+            next_cursor=encode_keyset_cursor(object_list[-1],ordering)
+        if (more and previous) or (cursor and not previous):
+            previous_cursor=encode_keyset_cursor(object_list[0],ordering,True)
+    return KeysetPage(object_list,next_cursor,previous_cursor,total)
 
-def paginate_queryset(qs,page=1,items_per_page=25,request=None):
+def paginate_queryset(qs,page=1,items_per_page=25,request=None,keyset=False,ordering=None,count=None):
     """
     Returns a paginated object for a queryset using request data
 
-    Will use "page" and "items" from GET parameters sent
+    Will use "page" and "items" from GET parameters sent.
+
+    When keyset is True, queryset is paginated by keyset using "page" parameter as cursor. See
+    paginate_keyset for ordering and count parameters.
     """
     # Obtain pagination parameters
     if request is not None:
@@ -181,6 +604,15 @@ def paginate_queryset(qs,page=1,items_per_page=25,request=None):
             items_per_page=request.GET.get('pageitems',items_per_page)    
         except:
             pass
+
+    if keyset:
+        try:
+            items_per_page=int(items_per_page)
+        except (TypeError,ValueError):
+            items_per_page=25
+        if page == 1:
+            page=None
+        return paginate_keyset(qs,page,items_per_page,ordering,count)
     
     # Create paginator
     paginator = Paginator(qs, items_per_page)
@@ -197,24 +629,83 @@ def paginate_queryset(qs,page=1,items_per_page=25,request=None):
 
     return paginatedqs
 
-def generate_unique_code(model,field,length=8,charset=string.digits + string.ascii_lowercase,filters={}):
+# Maximum number of candidates checked in a single query
+UNIQUE_CODES_MAX_BATCH=500
+
+def generate_unique_codes(model,field,count,length=8,charset=string.digits + string.ascii_lowercase,filters={},batch_size=None):
+    """
+    Generate a list of unique values for a given field of a given model
+
+    Candidates are generated in batches of up to UNIQUE_CODES_MAX_BATCH values, checked using a
+    single query for each batch
+    """
+    if batch_size is None:
+        batch_size=max(count * 2,10)
+    batch_size=min(batch_size,UNIQUE_CODES_MAX_BATCH)
+    codes=[]
+    while len(codes) < count:
+        candidates=set([''.join([random.choice(charset) for x in range(length)]) for i in range(batch_size)])
+        candidates.difference_update(codes)
+        used=model.objects.filter(**{ '%s__in' % field: list(candidates) }).filter(**filters).values_list(field,flat=True)
+        candidates.difference_update(used)
+        codes.extend(list(candidates)[:count - len(codes)])
+    return codes
+
+def generate_unique_code(model,field,length=8,charset=string.digits + string.ascii_lowercase,filters={},batch_size=10):
     """
     Generate an unique value for a given field of a given model
     """
-    value=''.join([random.choice(charset) for x in range(length)])
-    while model.objects.filter(**{ field: value }).filter(**filters).count() > 0:
-        value=''.join([random.choice(charset) for x in range(length)])
-    return value
+    return generate_unique_codes(model,field,1,length,charset,filters,batch_size)[0]
 
-def generate_unique_slug(model,slugfield,text,uniqueid=None,length=5,charset=string.digits + string.ascii_lowercase,filters={}):
+def generate_unique_slug(model,slugfield,text,uniqueid=None,length=5,charset=string.digits + string.ascii_lowercase,filters={},numeric=True):
     """
     Generate an unique value for a given slug field of a given model
+
+    If the slug is already used, the unique ID is appended if given and free. Otherwise, the next
+    numeric suffix after the greatest one in database is appended, or a random one from charset
+    if numeric is False.
     """
-    addedid=False
     slug=slugify(text)
-    while model.objects.filter(**{ slugfield: slug }).filter(**filters).count() > 0:
-        if uniqueid and not addedid:
-            slug+='-%s' % uniqueid
-        else:
-            slug+='-%s' % ''.join([random.choice(charset) for x in range(length)])
-    return slug
+    prefix='%s-' % slug
+    qs=model.objects.filter(**filters)
+    candidates=[slug]
+    if uniqueid:
+        candidates.append('%s%s' % (prefix,uniqueid))
+    existing=set(qs.filter(**{ '%s__in' % slugfield: candidates }).values_list(slugfield,flat=True))
+    for candidate in candidates:
+        if candidate not in existing:
+            return candidate
+    if numeric:
+        # Slugs only contain letters, digits, underscores and hyphens, so they need no escaping.
+        # Longest suffix sorts first, so the greatest number is found by the database
+        last=qs.filter(**{ '%s__regex' % slugfield: r'^%s[0-9]+$' % prefix }) \
+            .annotate(slug_length=Length(slugfield)).order_by('-slug_length','-%s' % slugfield) \
+            .values_list(slugfield,flat=True).first()
+        suffix=int(last[len(prefix):]) if last else 1
+        return '%s%d' % (prefix,suffix + 1)
+    while True:
+        candidates=['%s%s' % (prefix,''.join([random.choice(charset) for x in range(length)])) for i in range(10)]
+        existing=set(qs.filter(**{ '%s__in' % slugfield: candidates }).values_list(slugfield,flat=True))
+        for candidate in candidates:
+            if candidate not in existing:
+                return candidate
+
+def save_with_unique_value(instance,field,generate,attempts=5,**kwargs):
+    """
+    Save a model instance setting a generated value for a field, retrying on integrity errors
+
+    Avoids race conditions between checking and inserting values for fields with unique
+    constraints in database. Each attempt is done in a savepoint.
+
+    :param generate: Function returning a new value for field
+    :param attempts: Maximum number of attempts before raising the integrity error
+    """
+    for attempt in range(attempts):
+        setattr(instance,field,generate())
+        try:
+            with transaction.atomic():
+                instance.save(**kwargs)
+            return instance
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
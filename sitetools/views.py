@@ -11,25 +11,33 @@
 
 # Python imports
 import os
+import time
+import hashlib
 
 # Django imports
 from django.template.response import TemplateResponse
-from django.template.loader import render_to_string
+from django.template.loader import render_to_string, get_template
+from django.template import TemplateDoesNotExist
 from django.utils.translation import ugettext,ugettext_lazy as _
 from django.contrib.auth.decorators import login_required
 from django.utils.translation import ugettext
 from django.core.urlresolvers import reverse
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date
+from django.utils.encoding import force_bytes
+from django.utils._os import safe_join
+from django.core.exceptions import SuspiciousFileOperation
 from django.shortcuts import redirect
 from django.conf import settings
-from django.views.decorators.http import last_modified
 from django.views.decorators.csrf import ensure_csrf_cookie
 
 # Application imports
 from sitetools.http import JSONResponse
-from sitetools.utils import get_client_ip,get_site_from_request,static_serve,last_file_modification_date,generate_expiration_date
+from sitetools.utils import get_client_ip,get_site_from_request,static_serve,generate_expiration_date
+from sitetools.utils import get_static_manifest,get_hashed_static_name,get_file_metadata,is_not_modified
 from sitetools.forms.forms import ContactForm
 from sitetools.models import SiteLog, LegalDocument, LegalDocumentAcceptance
+from sitetools.models.models import robots_cache
 
 def close_cookies_alert(req):
     """
@@ -47,41 +55,91 @@ def service_unavailable(request,template_name='503.html'):
     """
     return TemplateResponse(request,template_name,status=503)
 
+def get_template_file_mtime(path):
+    """
+    Get template file modification time or None if it is not a file
+    """
+    if path:
+        metadata=get_file_metadata(path)
+        if metadata is not None:
+            return metadata.mtime
+    return None
+
 def robots(request,template_name='robots.txt',options={}):
     """
     Robots view
+
+    Contents are cached by site domain until site information or robots template file changes
     """
-    # Global robots
-    try:
-        data=render_to_string(template_name,options)
-    except IOError:
-        data=''
-    # Per site robots
     try:
         site=request.site
     except:
         # Get current site
         site = get_site_from_request(request)
-    try:
-        data+=site.siteinfo.robots
-    except:
-        pass
+    key=(site.domain,template_name,repr(sorted(options.items())))
+    entry=robots_cache.get(key)
+    if entry is not None and entry['template_mtime'] != get_template_file_mtime(entry['template_path']):
+        entry=None
+    if entry is None:
+        # Global robots
+        try:
+            template=get_template(template_name)
+            data=template.render(options)
+            template_path=getattr(getattr(template,'origin',None),'name',None)
+        except (IOError,TemplateDoesNotExist):
+            data=''
+            template_path=None
+        # Per site robots
+        try:
+            data+=site.siteinfo.robots
+        except:
+            pass
+        entry={
+            'content': data,
+            'etag': '"%s"' % hashlib.md5(force_bytes(data)).hexdigest(),
+            'mtime': int(time.time()),
+            'template_path': template_path,
+            'template_mtime': get_template_file_mtime(template_path),
+        }
+        robots_cache.set(key,entry)
     # Return robots.txt contents
-    return HttpResponse(data,content_type='text/plain')
+    if is_not_modified(request,entry['etag'],entry['mtime']):
+        response=HttpResponseNotModified()
+    else:
+        response=HttpResponse(entry['content'],content_type='text/plain')
+    response['ETag']=entry['etag']
+    response['Last-Modified']=http_date(entry['mtime'])
+    return response
 
 def favicon(request,iconfile='favicon.ico',options={}):
     """
     Favicon view
+
+    Icon is served from its hashed version if it is in static files manifest
     """
     # Return icon
-    return static_serve('%s/%s' % (settings.STATIC_ROOT,iconfile))
+    return static_serve('%s/%s' % (settings.STATIC_ROOT,get_hashed_static_name(iconfile)),request=request)
 
-@last_modified(last_file_modification_date)
 def static_serve_view(request,path,root=settings.STATIC_ROOT):
     """
     Static serving
-    """
-    return static_serve(os.path.join(root,path), extra_headers={'Expires': generate_expiration_date()})
+
+    Paths outside root directory are not found. Conditional requests are answered by the response using cached file metadata. Hashed files
+    from static files manifest are served as immutable
+    """
+    if path in get_static_manifest(root).hashed:
+        max_age=settings.STATIC_IMMUTABLE_MAX_AGE
+        headers={
+            'Expires': generate_expiration_date(max_age),
+            'Cache-Control': 'public, max-age=%d, immutable' % max_age,
+        }
+    else:
+        headers={'Expires': generate_expiration_date()}
+    try:
+        filepath=safe_join(root,path)
+    except SuspiciousFileOperation:
+        raise Http404(ugettext('File not found'))
+    return static_serve(filepath, extra_headers=headers, request=request)
 
 def legal_document_view(request,docid=None,version=None, template_name='legal/document_view.html'):
     """
@@ -117,6 +175,7 @@ def legal_document_acceptance(request,docid=None,version=None,template_name='leg
         # Mark document as accepted
         ip=get_client_ip(request)
         LegalDocumentAcceptance(documentversion=document,user=request.user,ip=ip).save()
+        request.session[LegalDocumentAcceptance.SESSION_KEY]='%s:%s' % (request.user.pk,document.pk)
         if next is not None:
             return redirect(next)
         else: